@@ -1,7 +1,8 @@
 from django.contrib import admin
+from django.db.models import F
 
 from .models import (Favourite, Ingredient, IngredientsInRecipe, Recipe,
-                     ShoppingCart, Tag)
+                     ShoppingCart, ShoppingListItem, Tag)
 
 
 @admin.register(Ingredient)
@@ -20,10 +21,7 @@ class TagAdmin(admin.ModelAdmin):
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ('id', 'author', 'name', 'cooking_time', 'favorites_count')
     list_filter = ('author', 'name', 'tags')
-
-    @admin.display(description='Количество в избранном')
-    def favorites_count(self, obj):
-        return obj.favorites.count()
+    readonly_fields = ('favorites_count', 'in_carts_count')
 
 
 @admin.register(IngredientsInRecipe)
@@ -33,9 +31,17 @@ class IngredientInRecipe(admin.ModelAdmin):
 
 @admin.register(Favourite)
 class FavouriteAdmin(admin.ModelAdmin):
-    list_display = ('id', 'user', 'recipe',)
+    list_display = ('id', 'user', 'recipe', 'added_at',)
+    ordering = (F('added_at').desc(nulls_last=True), '-id')
 
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
-    list_display = ['id', 'user', 'recipe']
+    list_display = ['id', 'user', 'recipe', 'added_at']
+    ordering = (F('added_at').desc(nulls_last=True), '-id')
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('id', 'user', 'ingredient', 'amount')
+    list_select_related = ('user', 'ingredient')
@@ -0,0 +1,20 @@
+from django.urls import URLPattern, include, path
+
+from .async_views import ASYNC_HANDLERS, async_view
+from .urls import router_v1
+
+app_name = 'api'
+
+
+def with_async(pattern):
+    '''Маршрут роутера с асинхронным обработчиком чтения, если он есть.'''
+    handler = ASYNC_HANDLERS.get(pattern.name)
+    if handler is None:
+        return pattern
+    return URLPattern(pattern.pattern, async_view(handler, pattern.callback),
+                      pattern.default_args, pattern.name)
+
+
+urlpatterns = [
+    path('', include([with_async(pattern) for pattern in router_v1.urls])),
+]
@@ -0,0 +1,264 @@
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+from django_filters.utils import translate_validation
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import APIException
+from rest_framework.filters import OrderingFilter
+from rest_framework.request import Request
+from rest_framework.views import exception_handler
+
+from .cache import (ANONYMOUS_STALE_TIMEOUT, INGREDIENTS_VERSION,
+                    RECIPES_VERSION, RESPONSE_CACHE_TIMEOUT, TAGS_VERSION,
+                    anonymous_cache_key, anonymous_lock_key, anonymous_lookup,
+                    anonymous_response, count_anonymous, not_modified,
+                    recipe_version_key, response_cache_key, response_etag)
+from .filters import IngredientFilter, RecipeFilter
+from .models import Ingredient, Recipe, Tag
+from .pagination import FeedPagination, KeysetPagination
+from .relations import user_relations
+from .renderers import FastJSONRenderer
+from .serializers import (IngredientSerializer, ReadRecipeSerializer,
+                          TagSerializer)
+
+ASYNC_METHODS = ('GET', 'HEAD')
+JSON_MEDIA_TYPES = ('application/json', 'application/*', '*/*')
+
+renderer = FastJSONRenderer()
+
+
+class AsyncNotSupportedError(Exception):
+    '''Запрос должно обработать синхронное представление.'''
+
+
+def wants_json(request, kwargs):
+    '''Клиент ждет JSON без отступов, который DRF отдает по умолчанию.'''
+    if 'format' in kwargs or request.GET.get('format', 'json') != 'json':
+        return False
+    accept = request.headers.get('Accept', '*/*')
+    return ('text/html' not in accept and 'indent' not in accept
+            and any(media_type in accept for media_type in JSON_MEDIA_TYPES))
+
+
+def json_response(data, status=200):
+    response = HttpResponse(renderer.render(data), status=status,
+                            content_type=renderer.media_type)
+    patch_vary_headers(response, ('Accept',))
+    return response
+
+
+def error_response(exc):
+    '''Ответ об ошибке в том же виде, что у представлений DRF.'''
+    response = exception_handler(exc, {})
+    return json_response(response.data, status=response.status_code)
+
+
+def async_view(handler, sync_view):
+    '''Асинхронное представление handler с запасным синхронным sync_view.
+
+    handler обслуживает GET и HEAD с ответом в JSON. Остальные запросы и
+    те, от которых handler отказался через AsyncNotSupportedError,
+    передаются sync_view в отдельном потоке, поэтому поведение маршрута
+    не меняется.
+    '''
+    sync_view = sync_to_async(sync_view)
+
+    @wraps(handler)
+    async def view(request, *args, **kwargs):
+        if request.method in ASYNC_METHODS and wants_json(request, kwargs):
+            try:
+                return await handler(request, *args, **kwargs)
+            except AsyncNotSupportedError:
+                pass
+            except (APIException, Http404) as exc:
+                return error_response(exc)
+        return await sync_view(request, *args, **kwargs)
+
+    view.csrf_exempt = True
+    return view
+
+
+async def authenticate(request):
+    '''Пользователь по заголовку Authorization, как в TokenAuthentication.
+
+    Ошибки аутентификации разбирает синхронное представление.
+    '''
+    auth = request.headers.get('Authorization', '').split()
+    if not auth or auth[0].lower() != 'token':
+        return AnonymousUser()
+    if len(auth) != 2:
+        raise AsyncNotSupportedError
+    try:
+        token = await Token.objects.select_related('user').aget(key=auth[1])
+    except Token.DoesNotExist:
+        raise AsyncNotSupportedError
+    if not token.user.is_active:
+        raise AsyncNotSupportedError
+    return token.user
+
+
+async def aget_object_or_404(queryset, **kwargs):
+    try:
+        return await queryset.aget(**kwargs)
+    except (queryset.model.DoesNotExist, TypeError, ValueError,
+            ValidationError):
+        raise Http404
+
+
+async def etag_cached(request, version_key, build):
+    '''Асинхронный вариант CachedReadOnlyMixin.cached_response.
+
+    Версия и ответ читаются из кэша за один переход в поток.
+    '''
+    def lookup():
+        etag = response_etag(version_key, request.path, request.GET)
+        return etag, cache.get(response_cache_key(etag))
+
+    etag, content = await sync_to_async(lookup)()
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return not_modified(etag)
+    if content is None:
+        content = renderer.render(await build())
+        await cache.aset(response_cache_key(etag), content,
+                         RESPONSE_CACHE_TIMEOUT)
+    response = HttpResponse(content, content_type=renderer.media_type)
+    response['ETag'] = etag
+    return response
+
+
+async def anonymous_cached(request, version_keys, build):
+    '''Асинхронный вариант AnonymousCacheMixin.anonymous_response.
+
+    Поиск в кэше и учет попадания выполняются за один переход в поток.
+    '''
+    key = anonymous_cache_key(request.get_host(), request.path, request.GET)
+
+    def lookup():
+        result = anonymous_lookup(key, version_keys)
+        if result[1] != 'miss':
+            count_anonymous(result[1])
+        return result
+
+    versions, outcome, content, locked = await sync_to_async(lookup)()
+    if outcome == 'miss':
+        try:
+            content = renderer.render(await build())
+        except (APIException, Http404):
+            await cache.adelete(key)
+            raise
+        else:
+            await cache.aset(key, (versions, time.time(), content),
+                             ANONYMOUS_STALE_TIMEOUT)
+        finally:
+            if locked:
+                await cache.adelete(anonymous_lock_key(key))
+        await sync_to_async(count_anonymous)(outcome)
+    return anonymous_response(content, outcome, renderer.media_type)
+
+
+async def tag_list(request):
+    async def build():
+        return TagSerializer(
+            [tag async for tag in Tag.objects.all()], many=True).data
+    return await etag_cached(request, TAGS_VERSION, build)
+
+
+async def tag_detail(request, pk):
+    async def build():
+        return TagSerializer(
+            await aget_object_or_404(Tag.objects.all(), pk=pk)).data
+    return await etag_cached(request, TAGS_VERSION, build)
+
+
+async def ingredient_list(request):
+    async def build():
+        queryset = await sync_to_async(IngredientFilter().filter_queryset)(
+            Request(request), Ingredient.objects.all(), None)
+        return IngredientSerializer(
+            [item async for item in queryset], many=True).data
+    return await etag_cached(request, INGREDIENTS_VERSION, build)
+
+
+async def ingredient_detail(request, pk):
+    async def build():
+        return IngredientSerializer(
+            await aget_object_or_404(Ingredient.objects.all(), pk=pk)).data
+    return await etag_cached(request, INGREDIENTS_VERSION, build)
+
+
+async def read_request(request):
+    '''Запрос DRF с пользователем по токену для фильтров и сериализаторов.
+
+    Связи пользователя загружаются заранее, чтобы сериализаторы не
+    обращались к базе в цикле событий.
+    '''
+    user = await authenticate(request)
+    request = Request(request)
+    request.user = user
+    if user.is_authenticated:
+        await sync_to_async(user_relations)(request)
+    return request
+
+
+async def filter_recipes(request):
+    '''Рецепты для чтения с фильтрами RecipeFilter, как в RecipeViewSet.'''
+    filterset = RecipeFilter(request.query_params,
+                             Recipe.objects.for_read(),
+                             request=request)
+    if not filterset.is_valid():
+        raise translate_validation(filterset.errors)
+    return await sync_to_async(getattr)(filterset, 'qs')
+
+
+async def recipe_list(request):
+    params = request.GET
+    if (params.get(FeedPagination.mode_query_param) == 'cursor'
+            or KeysetPagination.cursor_query_param in params
+            or OrderingFilter.ordering_param in params):
+        raise AsyncNotSupportedError
+    request = await read_request(request)
+
+    async def build():
+        pagination = FeedPagination()
+        page = await pagination.apaginate_queryset(
+            await filter_recipes(request), request)
+        serializer = ReadRecipeSerializer(page, many=True,
+                                          context={'request': request})
+        return pagination.get_paginated_response(serializer.data).data
+
+    if request.user.is_anonymous:
+        return await anonymous_cached(
+            request, (RECIPES_VERSION, TAGS_VERSION), build)
+    return json_response(await build())
+
+
+async def recipe_detail(request, pk):
+    request = await read_request(request)
+
+    async def build():
+        recipe = await aget_object_or_404(await filter_recipes(request),
+                                          pk=pk)
+        return ReadRecipeSerializer(recipe,
+                                    context={'request': request}).data
+
+    if request.user.is_anonymous:
+        return await anonymous_cached(
+            request, (recipe_version_key(pk), TAGS_VERSION), build)
+    return json_response(await build())
+
+
+ASYNC_HANDLERS = {
+    'tags-list': tag_list,
+    'tags-detail': tag_detail,
+    'ingredients-list': ingredient_list,
+    'ingredients-detail': ingredient_detail,
+    'recipes-list': recipe_list,
+    'recipes-detail': recipe_detail,
+}
@@ -0,0 +1,670 @@
+import asyncio
+import base64
+import gc
+import io
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.db.models import Prefetch
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import include, path
+from django.utils.http import urlencode
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.serializers import Serializer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from users.models import Follow
+from users.serializers import CustomUserSerializer
+
+from . import shopping_list
+from .models import (Favourite, Ingredient, IngredientsInRecipe, Recipe,
+                     ShoppingCart, Tag, User)
+from .renderers import FastJSONRenderer
+from .serializers import (FollowSerializer, IngredientsInRecipeSerializer,
+                          ReadRecipeSerializer, ShortRecipeSerializer,
+                          TagSerializer)
+
+PASSWORD = 'benchmark-password'
+EXPECTED_STATUS = {'post': 201, 'delete': 204}
+LATENCY_FACTOR = 3
+LATENCY_HEADROOM_MS = 10
+
+
+def make_image():
+    '''Маленькая PNG-картинка в base64 для создания рецептов.'''
+    buffer = io.BytesIO()
+    Image.new('RGB', (64, 64), 'orange').save(buffer, 'PNG')
+    return 'data:image/png;base64,' + base64.b64encode(
+        buffer.getvalue()).decode()
+
+
+class Dataset:
+    '''Синтетический набор данных для замеров.'''
+
+    def __init__(self, users=20, recipes=200, ingredients=500, tags=5,
+                 ingredients_per_recipe=8, follows=10, favorites=20,
+                 seed=0):
+        self.config = {
+            'users': users,
+            'recipes': recipes,
+            'ingredients': ingredients,
+            'tags': tags,
+            'ingredients_per_recipe': ingredients_per_recipe,
+            'follows': follows,
+            'favorites': favorites,
+        }
+        self.random = random.Random(seed)
+
+    def seed(self):
+        config = self.config
+        password = make_password(PASSWORD)
+        self.users = User.objects.bulk_create(
+            User(username=f'bench{i}', email=f'bench{i}@foodgram.ru',
+                 first_name='Имя', last_name='Фамилия', password=password)
+            for i in range(config['users']))
+        self.user = self.users[0]
+        self.token = Token.objects.create(user=self.user).key
+        self.tags = Tag.objects.bulk_create(
+            Tag(name=f'Тег {i}', color=f'#{i:06X}', slug=f'tag{i}')
+            for i in range(config['tags']))
+        self.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(config['ingredients']))
+        self.recipes = Recipe.objects.bulk_create(
+            Recipe(author=self.random.choice(self.users),
+                   name=f'Рецепт {i}', text='Описание рецепта',
+                   image='recipes/benchmark.png',
+                   cooking_time=self.random.randint(1, 120))
+            for i in range(config['recipes']))
+        IngredientsInRecipe.objects.bulk_create(
+            IngredientsInRecipe(recipe=recipe, ingredient=ingredient,
+                                amount=self.random.randint(1, 500))
+            for recipe in self.recipes
+            for ingredient in self.random.sample(
+                self.ingredients, config['ingredients_per_recipe']))
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in self.recipes
+            for tag in self.random.sample(self.tags, 2))
+        Follow.objects.bulk_create(
+            Follow(user=user, author=author)
+            for user in self.users
+            for author in self.random.sample(
+                [other for other in self.users if other != user],
+                min(config['follows'], len(self.users) - 1)))
+        for model in (Favourite, ShoppingCart):
+            model.objects.bulk_create(
+                model(user=user, recipe=recipe)
+                for user in self.users
+                for recipe in self.random.sample(
+                    self.recipes, config['favorites']))
+        call_command('reconcile_counters', stdout=io.StringIO())
+        call_command('rebuild_shopping_lists', stdout=io.StringIO())
+        call_command('compute_popularity', stdout=io.StringIO())
+        self.own_recipe = Recipe.objects.filter(author=self.user).first()
+        self.free_recipe = Recipe.objects.exclude(
+            favorites__user=self.user).exclude(
+            shopping_cart__user=self.user).first()
+        self.stranger = User.objects.exclude(
+            following__user=self.user).exclude(pk=self.user.pk).first()
+
+
+class Scenario:
+    '''Один запрос к API с подготовкой и откатом изменений.'''
+
+    def __init__(self, name, method, url, data=None, auth=True,
+                 setup=None, cleanup=None, status=None):
+        self.name = name
+        self.method = method
+        self.status = status or EXPECTED_STATUS.get(method, 200)
+        self.url = url
+        self.data = data
+        self.auth = auth
+        self.setup = setup
+        self.cleanup = cleanup
+
+    def run(self, client):
+        context = self.setup() if self.setup else None
+        url = self.url(context) if callable(self.url) else self.url
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = getattr(client, self.method)(
+                url, self.data, format='json')
+            if response.streaming:
+                b''.join(response.streaming_content)
+            elapsed = time.perf_counter() - start
+        if self.cleanup:
+            self.cleanup(response)
+        return response.status_code, len(queries), elapsed * 1000
+
+
+def build_scenarios(data):
+    '''Сценарии для всех маршрутов api/urls.py и users/urls.py.'''
+    user, recipe = data.user, data.free_recipe
+    tag, ingredient = data.tags[0], data.ingredients[0]
+    stranger, followed = data.stranger, user.follower.first().author
+    recipe_payload = {
+        'ingredients': [{'id': item.id, 'amount': 10}
+                        for item in data.ingredients[:5]],
+        'tags': [tag.id],
+        'image': make_image(),
+        'name': 'Новый рецепт',
+        'text': 'Описание',
+        'cooking_time': 10,
+    }
+
+    def delete_created(response):
+        Recipe.objects.filter(pk=response.json()['id']).delete()
+
+    def make_recipe():
+        return Recipe.objects.create(
+            author=user, name='Удаляемый', text='Текст',
+            image='recipes/benchmark.png', cooking_time=1)
+
+    def relation(model, **kwargs):
+        return (lambda: model.objects.get_or_create(**kwargs),
+                lambda response: model.objects.filter(**kwargs).delete())
+
+    add_favorite = relation(Favourite, user=user, recipe=recipe)
+    add_follow = relation(Follow, user=user, author=stranger)
+    plan = [item.id for item in Recipe.objects.exclude(
+        shopping_cart__user=user)[:20]]
+    bulk_payload = {'recipes': plan}
+
+    def remove_from_cart(recipes):
+        ShoppingCart.objects.filter(user=user, recipe_id__in=recipes).delete()
+
+    def add_to_cart(recipes):
+        ShoppingCart.objects.bulk_create(
+            (ShoppingCart(user=user, recipe_id=pk) for pk in recipes),
+            ignore_conflicts=True)
+        shopping_list.add_recipes(user.pk, recipes)
+    tags = '&'.join(f'tags={item.slug}' for item in data.tags[:2])
+    return [
+        Scenario('tags-list', 'get', '/api/tags/', auth=False),
+        Scenario('tags-detail', 'get', f'/api/tags/{tag.id}/', auth=False),
+        Scenario('ingredients-list', 'get', '/api/ingredients/',
+                 auth=False),
+        Scenario('ingredients-search', 'get',
+                 '/api/ingredients/?name=ингредиент 1', auth=False),
+        Scenario('ingredients-detail', 'get',
+                 f'/api/ingredients/{ingredient.id}/', auth=False),
+        Scenario('recipes-list-anonymous', 'get', '/api/recipes/',
+                 auth=False),
+        Scenario('recipes-list', 'get', '/api/recipes/?limit=50'),
+        Scenario('recipes-list-filtered', 'get',
+                 f'/api/recipes/?{tags}&is_favorited=1'),
+        Scenario('recipes-search', 'get',
+                 '/api/recipes/?search=рецепт 1&limit=50'),
+        Scenario('recipes-feed', 'get', '/api/recipes/feed/?limit=50'),
+        Scenario('recipes-popular', 'get',
+                 f'/api/recipes/popular/?{tags}&limit=50'),
+        Scenario('recipes-by-ingredients', 'get',
+                 '/api/recipes/by_ingredients/?ingredients='
+                 + ','.join(str(item.id) for item in data.ingredients[:30])),
+        Scenario('recipes-list-cursor', 'get',
+                 '/api/recipes/?pagination=cursor&limit=50'),
+        Scenario('recipes-detail', 'get', f'/api/recipes/{recipe.id}/'),
+        Scenario('recipes-create', 'post', '/api/recipes/', recipe_payload,
+                 cleanup=delete_created),
+        Scenario('recipes-update', 'patch',
+                 f'/api/recipes/{data.own_recipe.id}/', recipe_payload),
+        Scenario('recipes-delete', 'delete',
+                 lambda recipe: f'/api/recipes/{recipe.id}/',
+                 setup=make_recipe),
+        Scenario('favorite-add', 'post', f'/api/recipes/{recipe.id}/favorite/',
+                 cleanup=add_favorite[1]),
+        Scenario('favorite-remove', 'delete',
+                 f'/api/recipes/{recipe.id}/favorite/',
+                 setup=add_favorite[0]),
+        Scenario('shopping-cart-add', 'post',
+                 f'/api/recipes/{recipe.id}/shopping_cart/',
+                 cleanup=lambda response: remove_from_cart([recipe.id])),
+        Scenario('shopping-cart-remove', 'delete',
+                 f'/api/recipes/{recipe.id}/shopping_cart/',
+                 setup=lambda: add_to_cart([recipe.id])),
+        Scenario('shopping-cart-bulk-add', 'post',
+                 '/api/recipes/shopping_cart/', bulk_payload,
+                 cleanup=lambda response: remove_from_cart(plan)),
+        Scenario('shopping-cart-bulk-remove', 'delete',
+                 '/api/recipes/shopping_cart/', bulk_payload,
+                 setup=lambda: add_to_cart(plan), status=200),
+        Scenario('shopping-list', 'get', '/api/recipes/shopping_list/'),
+        Scenario('shopping-cart-download-pdf', 'get',
+                 '/api/recipes/download_shopping_cart/'),
+        Scenario('shopping-cart-download-txt', 'get',
+                 '/api/recipes/download_shopping_cart/?format=txt'),
+        Scenario('shopping-cart-download-csv', 'get',
+                 '/api/recipes/download_shopping_cart/?format=csv'),
+        Scenario('users-list', 'get', '/api/users/', auth=False),
+        Scenario('users-detail', 'get', f'/api/users/{followed.id}/'),
+        Scenario('users-me', 'get', '/api/users/me/'),
+        Scenario('subscriptions', 'get',
+                 '/api/users/subscriptions/?recipes_limit=3'),
+        Scenario('subscribe', 'post', f'/api/users/{stranger.id}/subscribe/',
+                 cleanup=add_follow[1]),
+        Scenario('unsubscribe', 'delete',
+                 f'/api/users/{stranger.id}/subscribe/',
+                 setup=add_follow[0]),
+        Scenario('auth-token-login', 'post', '/api/auth/token/login/',
+                 {'email': user.email, 'password': PASSWORD}, auth=False,
+                 status=200),
+    ]
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[round(fraction * (len(values) - 1))]
+
+
+class Benchmark:
+    '''Прогоняет сценарии и собирает количество запросов, задержки и
+    пиковое потребление памяти.'''
+
+    def __init__(self, dataset, iterations=20):
+        self.dataset = dataset
+        self.iterations = iterations
+
+    def run(self, only=None):
+        cache.clear()
+        self.dataset.seed()
+        scenarios = build_scenarios(self.dataset)
+        results = {}
+        for scenario in scenarios:
+            if only and scenario.name not in only:
+                continue
+            results[scenario.name] = self.measure(scenario)
+        return {'dataset': self.dataset.config,
+                'iterations': self.iterations,
+                'results': results}
+
+    def client(self, scenario):
+        client = APIClient()
+        if scenario.auth:
+            client.credentials(
+                HTTP_AUTHORIZATION=f'Token {self.dataset.token}')
+        return client
+
+    def measure(self, scenario):
+        client = self.client(scenario)
+        timings, statuses, queries = [], set(), 0
+        for _ in range(self.iterations):
+            status, count, elapsed = scenario.run(client)
+            timings.append(elapsed)
+            statuses.add(status)
+            queries = max(queries, count)
+        # Мусор прошлых прогонов со ссылочными циклами иначе собирается
+        # посреди замера, и пик зависит от момента сборки.
+        gc.collect()
+        tracemalloc.start()
+        scenario.run(client)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return {
+            'status': sorted(statuses),
+            'expected_status': scenario.status,
+            'queries': queries,
+            'p50_ms': round(percentile(timings, 0.5), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'peak_memory_kb': round(peak / 1024, 1),
+        }
+
+
+def latency_limit(p95_ms, factor=LATENCY_FACTOR,
+                  headroom_ms=LATENCY_HEADROOM_MS):
+    '''Порог p95 с запасом для задержки p95_ms.'''
+    return round(max(p95_ms * factor, p95_ms + headroom_ms), 2)
+
+
+def check_thresholds(report, thresholds, baseline=None):
+    '''Список расхождений отчета report с ожиданиями.
+
+    Проверяет коды ответов сценариев и пороги из thresholds. Если передан
+    отчет baseline, снятый на той же машине, порог p95_ms считается от его
+    задержек: абсолютные пороги из файла верны только для эталонной машины.
+    '''
+    failures = []
+    for name, result in report['results'].items():
+        if result['status'] != [result['expected_status']]:
+            failures.append(f'{name}: status = {result["status"]}, '
+                            f'ожидался {result["expected_status"]}')
+    for name, limits in thresholds.items():
+        result = report['results'].get(name)
+        if result is None:
+            continue
+        reference = baseline and baseline['results'].get(name)
+        if reference:
+            limits = {**limits, 'p95_ms': latency_limit(reference['p95_ms'])}
+        for metric, limit in limits.items():
+            if result[metric] > limit:
+                failures.append(
+                    f'{name}: {metric} = {result[metric]} > {limit}')
+    return failures
+
+
+def make_thresholds(report, memory_factor=2):
+    '''Пороги по текущему отчету: запросы точно, время и память с
+    запасом.'''
+    return {
+        name: {
+            'queries': result['queries'],
+            'p95_ms': latency_limit(result['p95_ms']),
+            'peak_memory_kb': round(result['peak_memory_kb']
+                                    * memory_factor, 1),
+        }
+        for name, result in report['results'].items()
+    }
+
+
+class SyncURLConf:
+    '''Маршруты API с синхронными представлениями.'''
+    urlpatterns = [path('api/', include('api.urls', namespace='api'))]
+
+
+class AsyncURLConf:
+    '''Маршруты API с асинхронными представлениями чтения.'''
+    urlpatterns = [path('api/', include('api.async_urls', namespace='api'))]
+
+
+def wsgi_environ(path, query, headers):
+    environ = {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SERVER_NAME': 'testserver',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+    }
+    for name, value in headers.items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    return environ
+
+
+def asgi_scope(path, query, headers):
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'root_path': '',
+        'query_string': query.encode(),
+        'headers': [(b'host', b'testserver')] + [
+            (name.lower().encode(), value.encode())
+            for name, value in headers.items()],
+        'server': ('testserver', 80),
+        'client': ('127.0.0.1', 0),
+    }
+
+
+async def asgi_get(application, scope):
+    '''Выполнить запрос к ASGI-приложению и вернуть код ответа.'''
+    status = None
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await application(dict(scope), receive, send)
+    return status
+
+
+class ConcurrencyBenchmark:
+    '''Пропускная способность чтения при множестве одновременных
+    клиентов.
+
+    Синхронные представления через WSGI обслуживают workers потоков, как
+    синхронные воркеры gunicorn, асинхронные - один цикл событий ASGI.
+    Задержка db_latency_ms добавляется к каждому SQL-запросу и
+    моделирует базу данных по сети.
+    '''
+
+    def __init__(self, dataset, requests=200, concurrency=50, workers=1,
+                 db_latency_ms=5):
+        self.dataset = dataset
+        self.requests = requests
+        self.concurrency = concurrency
+        self.workers = workers
+        self.db_latency_ms = db_latency_ms
+
+    def targets(self):
+        data = self.dataset
+        return [
+            ('tags-list', '/api/tags/', '', False),
+            ('ingredients-search', '/api/ingredients/',
+             urlencode({'name': 'ингредиент 1'}), False),
+            ('recipes-list-anonymous', '/api/recipes/', '', False),
+            ('recipes-list', '/api/recipes/', 'limit=50', True),
+            ('recipes-detail', f'/api/recipes/{data.free_recipe.id}/', '',
+             True),
+        ]
+
+    def run(self, only=None):
+        cache.clear()
+        self.dataset.seed()
+        results = {}
+        connection_created.connect(self.add_latency)
+        try:
+            for name, url, query, auth in self.targets():
+                if only and name not in only:
+                    continue
+                headers = ({'Authorization': f'Token {self.dataset.token}'}
+                           if auth else {})
+                with override_settings(ROOT_URLCONF=SyncURLConf):
+                    sync = self.measure_sync(url, query, headers)
+                with override_settings(ROOT_URLCONF=AsyncURLConf):
+                    asynchronous = self.measure_async(url, query, headers)
+                results[name] = {
+                    'sync': sync,
+                    'async': asynchronous,
+                    'speedup': round(asynchronous['rps'] / sync['rps'], 2),
+                }
+        finally:
+            connection_created.disconnect(self.add_latency)
+        return {'dataset': self.dataset.config,
+                'requests': self.requests,
+                'concurrency': self.concurrency,
+                'workers': self.workers,
+                'db_latency_ms': self.db_latency_ms,
+                'results': results}
+
+    def add_latency(self, sender, connection, **kwargs):
+        if self.db_latency_ms:
+            connection.execute_wrappers.append(self.delay)
+
+    def delay(self, execute, sql, params, many, context):
+        time.sleep(self.db_latency_ms / 1000)
+        return execute(sql, params, many, context)
+
+    def shares(self):
+        '''Сколько запросов делает каждый из клиентов.'''
+        count, extra = divmod(self.requests, self.concurrency)
+        return [count + (client < extra)
+                for client in range(self.concurrency)]
+
+    def measure_sync(self, path, query, headers):
+        handler = WSGIHandler()
+        slots = threading.Semaphore(self.workers)
+
+        def request():
+            with slots:
+                response = handler(wsgi_environ(path, query, headers),
+                                   lambda status, headers: None)
+                b''.join(response)
+                response.close()
+            return response.status_code
+
+        def client(count):
+            timings, statuses = [], set()
+            for _ in range(count):
+                start = time.perf_counter()
+                statuses.add(request())
+                timings.append(time.perf_counter() - start)
+            return timings, statuses
+
+        request()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(self.concurrency) as pool:
+            results = list(pool.map(client, self.shares()))
+        return self.summary(results, time.perf_counter() - start)
+
+    def measure_async(self, path, query, headers):
+        handler = ASGIHandler()
+        scope = asgi_scope(path, query, headers)
+
+        async def client(count):
+            timings, statuses = [], set()
+            for _ in range(count):
+                start = time.perf_counter()
+                statuses.add(await asgi_get(handler, scope))
+                timings.append(time.perf_counter() - start)
+            return timings, statuses
+
+        async def clients():
+            return await asyncio.gather(
+                *(client(count) for count in self.shares()))
+
+        asyncio.run(asgi_get(handler, scope))
+        start = time.perf_counter()
+        results = asyncio.run(clients())
+        return self.summary(results, time.perf_counter() - start)
+
+    def summary(self, results, elapsed):
+        timings = [timing for client_timings, _ in results
+                   for timing in client_timings]
+        return {
+            'status': sorted(set().union(
+                *(statuses for _, statuses in results))),
+            'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(percentile(timings, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(timings, 0.95) * 1000, 2),
+        }
+
+
+class GenericTagSerializer(TagSerializer):
+    to_representation = Serializer.to_representation
+
+
+class GenericUserSerializer(CustomUserSerializer):
+    to_representation = Serializer.to_representation
+
+
+class GenericIngredientsInRecipeSerializer(IngredientsInRecipeSerializer):
+    to_representation = Serializer.to_representation
+
+
+class GenericReadRecipeSerializer(ReadRecipeSerializer):
+    '''Рецепт через обход полей DRF, как до ручных to_representation.'''
+    tags = GenericTagSerializer(read_only=True, many=True)
+    ingredients = GenericIngredientsInRecipeSerializer(
+        source='recipe', many=True, read_only=True)
+    author = GenericUserSerializer(read_only=True)
+    to_representation = Serializer.to_representation
+
+
+class GenericShortRecipeSerializer(ShortRecipeSerializer):
+    to_representation = Serializer.to_representation
+
+
+class GenericFollowSerializer(FollowSerializer):
+    to_representation = Serializer.to_representation
+
+    def get_recipes(self, obj):
+        return GenericShortRecipeSerializer(obj.limited_recipes, many=True,
+                                            context=self.context).data
+
+
+class SerializationBenchmark:
+    '''Сериализация и рендеринг больших страниц чтения.
+
+    Сравнивает обход полей DRF с JSONRenderer и ручные
+    to_representation с FastJSONRenderer на одних и тех же
+    предзагруженных объектах и проверяет, что ответы совпадают побайтно.
+    '''
+
+    def __init__(self, dataset, iterations=20):
+        self.dataset = dataset
+        self.iterations = iterations
+
+    def targets(self, user):
+        authors = User.objects.all()
+        recipes = Recipe.objects.only('id', 'name', 'image', 'variants_image',
+                                      'cooking_time', 'author')
+        following = authors.filter(following__user=user).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes'))
+        return [
+            ('recipes', GenericReadRecipeSerializer, ReadRecipeSerializer,
+             Recipe.objects.for_read()),
+            ('users', GenericUserSerializer, CustomUserSerializer, authors),
+            ('subscriptions', GenericFollowSerializer, FollowSerializer,
+             following),
+        ]
+
+    def run(self, only=None):
+        self.dataset.seed()
+        request = Request(APIRequestFactory().get('/api/'))
+        request.user = self.dataset.user
+        results = {}
+        for name, generic, fast, queryset in self.targets(request.user):
+            if only and name not in only:
+                continue
+            objects = list(queryset)
+            reference = self.measure(generic, JSONRenderer(), objects,
+                                     request)
+            result = self.measure(fast, FastJSONRenderer(), objects,
+                                  request)
+            results[name] = {
+                'objects': len(objects),
+                'drf': reference,
+                'fast': result,
+                'identical': reference.pop('content') == result.pop(
+                    'content'),
+                'speedup': round(reference['total_ms']
+                                 / result['total_ms'], 2),
+            }
+        return {'dataset': self.dataset.config,
+                'iterations': self.iterations,
+                'results': results}
+
+    def measure(self, serializer_class, renderer, objects, request):
+        serialize, render = [], []
+        for _ in range(self.iterations):
+            start = time.perf_counter()
+            data = serializer_class(objects, many=True,
+                                    context={'request': request}).data
+            middle = time.perf_counter()
+            content = renderer.render(data)
+            serialize.append(middle - start)
+            render.append(time.perf_counter() - middle)
+        serialize_ms = percentile(serialize, 0.5) * 1000
+        render_ms = percentile(render, 0.5) * 1000
+        return {
+            'serialize_ms': round(serialize_ms, 2),
+            'render_ms': round(render_ms, 2),
+            'total_ms': round(serialize_ms + render_ms, 2),
+            'bytes': len(content),
+            'content': content,
+        }
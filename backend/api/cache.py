@@ -0,0 +1,272 @@
+import time
+from hashlib import md5
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_etags, urlencode
+
+TAGS_VERSION = 'tags_version'
+INGREDIENTS_VERSION = 'ingredients_version'
+RECIPES_VERSION = 'recipes_version'
+RECIPE_CHANGES = 'recipe_changes'
+RESPONSE_CACHE_TIMEOUT = 60 * 60 * 24
+CHANGES_TIMEOUT = 60 * 60
+MAX_REPLAY = 1000
+ANONYMOUS_FRESH_TIMEOUT = 60
+ANONYMOUS_STALE_TIMEOUT = 60 * 10
+ANONYMOUS_LOCK_TIMEOUT = 30
+ANONYMOUS_WAIT_TIMEOUT = 2
+ANONYMOUS_WAIT_INTERVAL = 0.05
+ANONYMOUS_OUTCOMES = ('hit', 'stale', 'miss')
+
+
+def get_version(key):
+    '''Текущая версия данных, хранящаяся в кэше под ключом key.'''
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(key):
+    '''Сменить версию данных, делая устаревшими все записи на её основе.'''
+    cache.set(key, uuid4().hex, None)
+
+
+def bump_versions(keys):
+    '''Сменить сразу несколько версий одним обращением к кэшу.'''
+    cache.set_many({key: uuid4().hex for key in keys}, None)
+
+
+def recipe_version_key(pk):
+    return f'recipe_version:{pk}'
+
+
+def get_sequence(key):
+    '''Номер последнего изменения в журнале key.
+
+    Журнал начинается со случайного номера, чтобы после очистки кэша
+    номера не совпали с уже виденными процессами.
+    '''
+    sequence = cache.get(key)
+    if sequence is None:
+        cache.add(key, uuid4().int >> 80, None)
+        sequence = cache.get(key)
+    return sequence
+
+
+def record_changes(key, ids):
+    '''Записать в журнал key id измененных объектов.'''
+    get_sequence(key)
+    try:
+        sequence = cache.incr(key)
+    except ValueError:
+        get_sequence(key)
+        sequence = cache.incr(key)
+    cache.set(f'{key}:{sequence}', list(ids), CHANGES_TIMEOUT)
+
+
+def reset_changes(key):
+    '''Начать журнал key заново: процессы перечитают данные целиком.'''
+    cache.delete(key)
+
+
+def changes_between(key, start, end):
+    '''Id объектов, измененных после start до end включительно, или None,
+    если часть журнала недоступна и данные нужно перечитать целиком.'''
+    if start is None or not 0 <= end - start <= MAX_REPLAY:
+        return None
+    entries = cache.get_many(
+        [f'{key}:{sequence}' for sequence in range(start + 1, end + 1)])
+    if len(entries) != end - start:
+        return None
+    return set().union(*entries.values())
+
+
+def response_etag(version_key, path, query_params):
+    '''ETag ответа по версии данных version_key и запросу.'''
+    params = urlencode(sorted(query_params.lists()), doseq=True)
+    return '"{}"'.format(md5('{}:{}?{}'.format(
+        get_version(version_key), path, params).encode()).hexdigest())
+
+
+def response_cache_key(etag):
+    return f'response:{etag}'
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response['ETag'] = etag
+    return response
+
+
+class CachedReadOnlyMixin:
+    '''Кэширует готовые JSON-ответы list и retrieve вместе с ETag.
+
+    Ключ и ETag строятся из версии данных cache_version_key и запроса,
+    поэтому условный запрос с If-None-Match и попадание в кэш
+    обслуживаются без обращения к базе данных.
+    '''
+    cache_version_key = None
+
+    def perform_authentication(self, request):
+        '''Справочники доступны всем: пользователь определяется лениво.'''
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        if renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+        etag = response_etag(self.cache_version_key, request.path,
+                             request.query_params)
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            return not_modified(etag)
+        key = response_cache_key(etag)
+        content = cache.get(key)
+        if content is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            content = renderer.render(
+                response.data, renderer.media_type,
+                self.get_renderer_context())
+            cache.set(key, content, RESPONSE_CACHE_TIMEOUT)
+        response = HttpResponse(content, content_type=renderer.media_type)
+        response['ETag'] = etag
+        return response
+
+
+def anonymous_stats_key(outcome):
+    return f'anonymous_cache:{outcome}'
+
+
+def count_anonymous(outcome):
+    key = anonymous_stats_key(outcome)
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+
+def anonymous_cache_stats():
+    '''Счетчики попаданий, устаревших ответов и промахов кэша.'''
+    values = cache.get_many(
+        [anonymous_stats_key(outcome) for outcome in ANONYMOUS_OUTCOMES])
+    return {outcome: values.get(anonymous_stats_key(outcome), 0)
+            for outcome in ANONYMOUS_OUTCOMES}
+
+
+def anonymous_cache_key(host, path, query_params):
+    params = urlencode(sorted(
+        (name, sorted(values))
+        for name, values in query_params.lists()), doseq=True)
+    return 'anonymous:' + md5('{}{}?{}'.format(
+        host, path, params).encode()).hexdigest()
+
+
+def anonymous_lock_key(key):
+    return f'{key}:lock'
+
+
+def anonymous_lookup(key, version_keys):
+    '''Текущие версии данных, исход поиска ответа в кэше, сам ответ и
+    признак взятой блокировки.
+
+    Отсутствующий или устаревший ответ собирает один запрос, взявший
+    блокировку anonymous_lock_key: для него исход miss, и после сборки он
+    снимает блокировку. Остальные тем временем получают устаревший ответ,
+    а если его нет, ждут новый до ANONYMOUS_WAIT_TIMEOUT секунд. Не
+    дождавшись, запрос собирает ответ сам, без блокировки.
+    '''
+    versions = ':'.join(
+        get_version(version_key) for version_key in version_keys)
+    lock_key = anonymous_lock_key(key)
+
+    def fresh(entry):
+        entry_versions, created, _ = entry
+        return (entry_versions == versions
+                and time.time() - created < ANONYMOUS_FRESH_TIMEOUT)
+
+    def found(entry):
+        return versions, 'hit' if fresh(entry) else 'stale', entry[2], False
+
+    entry = cache.get(key)
+    if entry is not None and fresh(entry):
+        return found(entry)
+    if cache.add(lock_key, 1, ANONYMOUS_LOCK_TIMEOUT):
+        return versions, 'miss', None, True
+    if entry is not None:
+        return found(entry)
+    deadline = time.monotonic() + ANONYMOUS_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(ANONYMOUS_WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return found(entry)
+        if cache.get(lock_key) is None:
+            break
+    return versions, 'miss', None, False
+
+
+def anonymous_response(content, outcome, content_type):
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Cache'] = outcome.upper()
+    return response
+
+
+class AnonymousCacheMixin:
+    '''Кэширует list и retrieve для анонимных пользователей.
+
+    Флаги пользователя у анонимов всегда ложные, поэтому ответ зависит
+    только от запроса и версий данных: списка (RECIPES_VERSION), рецепта
+    (recipe_version_key) и тегов. Запись свежая ANONYMOUS_FRESH_TIMEOUT
+    секунд и при совпадении версий. Отсутствующую или устаревшую запись
+    пересобирает один запрос, взявший блокировку (см. anonymous_lookup).
+    Результат отдается в заголовке X-Cache и учитывается в счетчиках.
+    '''
+
+    def list(self, request, *args, **kwargs):
+        return self.anonymous_response(
+            super().list, (RECIPES_VERSION, TAGS_VERSION),
+            request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.anonymous_response(
+            super().retrieve, (recipe_version_key(pk), TAGS_VERSION),
+            request, *args, **kwargs)
+
+    def anonymous_response(self, handler, version_keys, request, *args,
+                           **kwargs):
+        renderer = request.accepted_renderer
+        if not request.user.is_anonymous or renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+        key = anonymous_cache_key(
+            request.get_host(), request.path, request.query_params)
+        versions, outcome, content, locked = anonymous_lookup(
+            key, version_keys)
+        if outcome == 'miss':
+            try:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != 200:
+                    cache.delete(key)
+                    return response
+                content = renderer.render(
+                    response.data, renderer.media_type,
+                    self.get_renderer_context())
+                cache.set(key, (versions, time.time(), content),
+                          ANONYMOUS_STALE_TIMEOUT)
+            finally:
+                if locked:
+                    cache.delete(anonymous_lock_key(key))
+        count_anonymous(outcome)
+        return anonymous_response(content, outcome, renderer.media_type)
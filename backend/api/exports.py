@@ -0,0 +1,123 @@
+import csv
+import io
+
+from django.conf import settings
+from django.core.cache import cache
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+from .cache import bump_version, get_version
+from .shopping_list import get_rows
+
+FONT_NAME = 'arial'
+FONT_PATH = settings.BASE_DIR / 'fronts' / 'arial.ttf'
+FONT_SIZE = 14
+PAGE_TOP = 800
+PAGE_BOTTOM = 50
+LINE_HEIGHT = 20
+X_POSITION = 50
+EXPORT_CACHE_TIMEOUT = 60 * 60 * 24
+TITLE = 'Cписок покупок:'
+
+INGREDIENT_NAME = 'name'
+INGREDIENT_UNIT = 'measurement_unit'
+AMOUNT_SUM = 'amount'
+
+
+def register_fonts():
+    '''Регистрирует шрифты для PDF. Вызывается один раз при старте.'''
+    pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+
+
+def cart_version_key(user_id):
+    return f'shopping_cart_version:{user_id}'
+
+
+def invalidate_shopping_cart(user_id):
+    '''Сбросить закэшированные выгрузки корзины пользователя.'''
+    bump_version(cart_version_key(user_id))
+
+
+class Echo:
+    '''Псевдо-файл для csv.writer, возвращающий записанную строку.'''
+
+    def write(self, value):
+        return value
+
+
+class ShoppingCartExport:
+    '''Выгрузка списка покупок пользователя в одном из форматов.'''
+    content_types = {
+        'pdf': 'application/pdf',
+        'txt': 'text/plain; charset=utf-8',
+        'csv': 'text/csv; charset=utf-8',
+    }
+
+    def __init__(self, user, export_format):
+        self.user = user
+        self.format = export_format
+        self.cache_key = 'shopping_cart:{}:{}:{}'.format(
+            user.id, get_version(cart_version_key(user.id)), export_format)
+
+    @property
+    def filename(self):
+        return f'shopping_cart.{self.format}'
+
+    @property
+    def content_type(self):
+        return self.content_types[self.format]
+
+    def get_cached(self):
+        return cache.get(self.cache_key)
+
+    def render(self):
+        '''Полностью сформировать файл и сохранить его в кэш.'''
+        content = b''.join(self._chunks())
+        cache.set(self.cache_key, content, EXPORT_CACHE_TIMEOUT)
+        return content
+
+    def stream(self):
+        '''Отдавать файл по частям, сохранив его в кэш по окончании.'''
+        chunks = []
+        for chunk in self._chunks():
+            chunks.append(chunk)
+            yield chunk
+        cache.set(self.cache_key, b''.join(chunks), EXPORT_CACHE_TIMEOUT)
+
+    def _chunks(self):
+        rows = get_rows(self.user)
+        return getattr(self, f'_{self.format}')(rows)
+
+    def _txt(self, rows):
+        yield f'{TITLE}\n'.encode()
+        for num, row in enumerate(rows, start=1):
+            yield (f'{num}. {row[INGREDIENT_NAME]}: {row[AMOUNT_SUM]} '
+                   f'{row[INGREDIENT_UNIT]}.\n').encode()
+
+    def _csv(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(
+            ('Ингредиент', 'Количество', 'Единица измерения')).encode()
+        for row in rows:
+            yield writer.writerow((row[INGREDIENT_NAME], row[AMOUNT_SUM],
+                                   row[INGREDIENT_UNIT])).encode()
+
+    def _pdf(self, rows):
+        buffer = io.BytesIO()
+        page = canvas.Canvas(buffer)
+        page.setFont(FONT_NAME, FONT_SIZE)
+        y_position = PAGE_TOP
+        page.drawString(X_POSITION, y_position, TITLE)
+        for num, row in enumerate(rows, start=1):
+            y_position -= LINE_HEIGHT
+            if y_position < PAGE_BOTTOM:
+                page.showPage()
+                page.setFont(FONT_NAME, FONT_SIZE)
+                y_position = PAGE_TOP
+            page.drawString(
+                X_POSITION, y_position,
+                f'{num}. {row[INGREDIENT_NAME]}: {row[AMOUNT_SUM]} '
+                f'{row[INGREDIENT_UNIT]}.')
+        page.save()
+        yield buffer.getvalue()
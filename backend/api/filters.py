@@ -1,39 +1,116 @@
+from django import forms
+from django.core.cache import cache
+from django.db.models import Case, Count, Exists, OuterRef, When
 from django_filters.rest_framework import FilterSet, filters
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend
 
-from users.models import User
-from .models import Recipe
+from .cache import TAGS_VERSION, get_version
+from .indexes import ingredient_index
+from .models import Favourite, Recipe, ShoppingCart, Tag
+from .search import search_recipes
 
+TAG_MAP_TIMEOUT = 60 * 60 * 24
+RecipeTag = Recipe.tags.through
 
-class IngredientFilter(SearchFilter):
-    '''Фильтр для ингредиентов.'''
+
+def tag_ids_by_slug():
+    '''Словарь slug -> id всех тегов, закэшированный до их изменения.'''
+    key = f'tag_ids_by_slug:{get_version(TAGS_VERSION)}'
+    tags = cache.get(key)
+    if tags is None:
+        tags = dict(Tag.objects.values_list('slug', 'id'))
+        cache.set(key, tags, TAG_MAP_TIMEOUT)
+    return tags
+
+
+class SlugListField(forms.Field):
+    '''Список значений из повторяющегося параметра запроса.'''
+    widget = forms.SelectMultiple
+
+    def to_python(self, value):
+        return [slug for slug in value or () if slug]
+
+
+class SlugListFilter(filters.Filter):
+    field_class = SlugListField
+
+
+class IngredientFilter(BaseFilterBackend):
+    '''Автодополнение ингредиентов по индексу в памяти.'''
     search_param = 'name'
 
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param)
+        if not name:
+            return queryset
+        ids = ingredient_index.search(name)
+        if not ids:
+            return queryset.none()
+        return queryset.filter(pk__in=ids).order_by(
+            Case(*(When(pk=pk, then=position)
+                   for position, pk in enumerate(ids))))
+
 
 class RecipeFilter(FilterSet):
     '''Фильтр для рецептов.'''
-    author = filters.ModelChoiceFilter(queryset=User.objects.all())
-    tags = filters.AllValuesMultipleFilter(field_name='tags__slug')
+    TAGS_ANY = 'any'
+    TAGS_ALL = 'all'
+
+    author = filters.NumberFilter(field_name='author')
+    tags = SlugListFilter(method='filter_tags')
+    tags_mode = filters.ChoiceFilter(
+        choices=((TAGS_ANY, 'Любой из тегов'), (TAGS_ALL, 'Все теги')),
+        method='filter_tags_mode', label='Режим фильтра по тегам')
     is_favorited = filters.BooleanFilter(method='filter_favorited',
                                          label='В избранном')
     is_in_shopping_cart = filters.BooleanFilter(method='filter_shopping_cart',
                                                 label='В корзине')
+    search = filters.CharFilter(method='filter_search', label='Поиск')
 
     class Meta:
         model = Recipe
         fields = ('tags',
+                  'tags_mode',
                   'author',
                   'is_favorited',
-                  'is_in_shopping_cart',)
+                  'is_in_shopping_cart',
+                  'search',)
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        tags = tag_ids_by_slug()
+        ids = {tags[slug] for slug in value if slug in tags}
+        if self.form.cleaned_data.get('tags_mode') == self.TAGS_ALL:
+            if len(ids) < len(set(value)):
+                return queryset.none()
+            return queryset.filter(pk__in=RecipeTag.objects.filter(
+                tag_id__in=ids).values('recipe_id').annotate(
+                matched=Count('tag_id')).filter(
+                matched=len(ids)).values('recipe_id'))
+        if not ids:
+            return queryset.none()
+        return queryset.filter(Exists(RecipeTag.objects.filter(
+            recipe_id=OuterRef('pk'), tag_id__in=ids)))
+
+    def filter_tags_mode(self, queryset, name, value):
+        return queryset
 
     def filter_favorited(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(favorites__user=user)
+            return queryset.filter(Exists(Favourite.objects.filter(
+                user=user, recipe_id=OuterRef('pk'))))
         return queryset
 
     def filter_shopping_cart(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(shopping_cart__user=user)
+            return queryset.filter(Exists(ShoppingCart.objects.filter(
+                user=user, recipe_id=OuterRef('pk'))))
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
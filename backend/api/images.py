@@ -0,0 +1,225 @@
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files import File
+from django.db import connection, transaction
+from drf_extra_fields.fields import Base64ImageField
+from PIL import Image, UnidentifiedImageError
+from rest_framework.exceptions import ValidationError
+
+from .cache import RECIPES_VERSION, bump_versions, recipe_version_key
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+MAX_IMAGE_SIZE = 5 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40_000_000
+DECODE_CHUNK = 64 * 1024
+IMAGE_WORKERS = 2
+ALLOWED_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+VARIANTS = {
+    'thumbnail': 160,
+    'card': 480,
+    'full': 1200,
+}
+VARIANT_FORMATS = {
+    'webp': 'WEBP',
+    'jpeg': 'JPEG',
+}
+VARIANTS_DIR = 'variants'
+
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+executor = ThreadPoolExecutor(max_workers=IMAGE_WORKERS,
+                              thread_name_prefix='images')
+
+
+class RecipeImageField(Base64ImageField):
+    '''Картинка в base64 с ограничением размера и именем по содержимому.
+
+    Декодирует данные частями во временный файл, одновременно считая
+    sha256. Если такая картинка уже сохранена, возвращает имя
+    существующего файла вместо повторной записи.
+    '''
+    max_base64_length = (MAX_IMAGE_SIZE + 2) // 3 * 4
+
+    def to_internal_value(self, data):
+        if data in self.EMPTY_VALUES:
+            return None
+        if not isinstance(data, str):
+            raise ValidationError('Картинка должна быть строкой base64.')
+        data = data.partition(';base64,')[2] or data
+        data = ''.join(data.split())
+        if len(data) > self.max_base64_length:
+            raise ValidationError(
+                f'Размер картинки не должен превышать '
+                f'{MAX_IMAGE_SIZE // (1024 * 1024)} МБ.')
+        file, digest = self.decode(data)
+        try:
+            extension = self.check_image(file)
+        except ValidationError:
+            file.close()
+            raise
+        name = f'{digest}.{extension}'
+        model_field = Recipe._meta.get_field('image')
+        existing = model_field.generate_filename(None, name)
+        if model_field.storage.exists(existing):
+            file.close()
+            return existing
+        return File(file, name=name)
+
+    def decode(self, data):
+        file = tempfile.SpooledTemporaryFile(max_size=DECODE_CHUNK * 16)
+        digest = hashlib.sha256()
+        try:
+            for start in range(0, len(data), DECODE_CHUNK):
+                chunk = base64.b64decode(data[start:start + DECODE_CHUNK],
+                                         validate=True)
+                digest.update(chunk)
+                file.write(chunk)
+        except (binascii.Error, ValueError):
+            file.close()
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        file.seek(0)
+        return file, digest.hexdigest()
+
+    def check_image(self, file):
+        try:
+            with Image.open(file) as image:
+                width, height = image.size
+                image_format = image.format
+                image.verify()
+        except Image.DecompressionBombError:
+            raise ValidationError('Слишком большое разрешение картинки.')
+        except (UnidentifiedImageError, OSError, SyntaxError):
+            raise ValidationError(self.INVALID_FILE_MESSAGE)
+        file.seek(0)
+        if image_format not in ALLOWED_FORMATS:
+            raise ValidationError(self.INVALID_TYPE_MESSAGE)
+        if width * height > MAX_IMAGE_PIXELS:
+            raise ValidationError('Слишком большое разрешение картинки.')
+        return ALLOWED_FORMATS[image_format]
+
+
+def variant_prefix(name):
+    '''Общее начало путей уменьшенных копий картинки name.'''
+    directory, filename = os.path.split(name)
+    return os.path.join(directory, VARIANTS_DIR,
+                        os.path.splitext(filename)[0])
+
+
+def variant_name(name, variant, extension):
+    '''Путь уменьшенной копии картинки name.'''
+    return f'{variant_prefix(name)}_{variant}.{extension}'
+
+
+def file_url(file, request=None):
+    '''Ссылка на файл, как в FileField.to_representation из DRF.'''
+    if not file:
+        return None
+    url = file.url
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+def variant_urls(recipe, request=None):
+    '''Ссылки на уменьшенные копии картинки рецепта.
+
+    Хранилище не проверяется: копии есть, только если variants_ready
+    отметил текущую картинку в variants_image. Иначе (копии еще строятся,
+    старый рецепт, ошибка при создании) возвращается None. Хранилище
+    строит ссылку только на первую копию: остальные отличаются от нее
+    окончанием имени файла. Если ссылка не заканчивается именем файла,
+    например подписана, каждая строится отдельно.
+    '''
+    image = recipe.image
+    if not image or recipe.variants_image != image.name:
+        return None
+    storage = image.storage
+    prefix = variant_prefix(image.name)
+    variants = [(variant, extension, f'{prefix}_{variant}.{extension}')
+                for variant in VARIANTS for extension in VARIANT_FORMATS]
+
+    def url(name):
+        url = storage.url(name)
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        return url
+
+    variant, extension, name = variants[0]
+    first = url(name)
+    suffix = f'_{variant}.{extension}'
+    urls = {}
+    for variant, extension, name in variants:
+        urls.setdefault(variant, {})[extension] = (
+            f'{first[:-len(suffix)]}_{variant}.{extension}'
+            if first.endswith(suffix) else url(name))
+    return urls
+
+
+def generate_variants(name, storage):
+    '''Создает отсутствующие уменьшенные копии картинки.
+
+    Возвращает число созданных копий или None, если создать их не
+    удалось.
+    '''
+    created = 0
+    try:
+        with storage.open(name) as file, Image.open(file) as original:
+            original.load()
+            for variant, size in VARIANTS.items():
+                for extension, image_format in VARIANT_FORMATS.items():
+                    path = variant_name(name, variant, extension)
+                    if storage.exists(path):
+                        continue
+                    image = original.copy()
+                    image.thumbnail((size, size))
+                    if image.mode not in ('RGB', 'L'):
+                        image = image.convert('RGB')
+                    buffer = io.BytesIO()
+                    image.save(buffer, image_format, quality=85)
+                    storage.save(path, File(buffer))
+                    created += 1
+    except Exception:
+        logger.exception('Не удалось создать копии картинки %s', name)
+        return None
+    return created
+
+
+def variants_ready(name):
+    '''Отметить, что у рецептов с картинкой name есть все копии.
+
+    Сбрасывает версии отмеченных рецептов: закэшированные ответы были
+    собраны без копий и иначе не показали бы их до следующего изменения
+    рецепта. Возвращает число отмеченных рецептов.
+    '''
+    recipes = Recipe.objects.filter(image=name).exclude(variants_image=name)
+    ids = list(recipes.values_list('pk', flat=True))
+    if ids:
+        Recipe.objects.filter(pk__in=ids).update(variants_image=name)
+        bump_versions([RECIPES_VERSION, *map(recipe_version_key, ids)])
+    return len(ids)
+
+
+def build_variants(name, storage):
+    '''Задача пула: создать копии и отметить рецепты с картинкой.'''
+    try:
+        if generate_variants(name, storage) is not None:
+            variants_ready(name)
+    finally:
+        connection.close()
+
+
+def schedule_variants(image):
+    '''Поставить создание копий картинки в пул после коммита.'''
+    if image:
+        name, storage = image.name, image.storage
+        transaction.on_commit(
+            lambda: executor.submit(build_variants, name, storage))
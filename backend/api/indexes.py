@@ -0,0 +1,335 @@
+import heapq
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, defaultdict
+
+from .cache import (INGREDIENTS_VERSION, RECIPE_CHANGES, bump_version,
+                    changes_between, get_sequence, get_version, reset_changes)
+from .models import Ingredient, IngredientsInRecipe, Recipe
+
+AUTOCOMPLETE_LIMIT = 20
+SEARCH_LIMIT = 1000
+MATCH_LIMIT = 1000
+WORD_START = re.compile(r'(?<=[\s\-(])\w')
+WORD = re.compile(r'\w+')
+MIN_STEM = 3
+NGRAM = 3
+ENDINGS = sorted((
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией',
+    'ться', 'ешь', 'ете', 'ишь', 'ите', 'ют', 'ут', 'ят', 'ат', 'ть',
+    'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ый', 'ий', 'ой', 'ей', 'ом', 'ем',
+    'ам', 'ям', 'ах', 'ях', 'ов', 'ев', 'ую', 'юю', 'ью', 'ия', 'ья', 'ье',
+    'ии', 'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+SEARCH_WEIGHTS = {
+    'name': 3,
+    'ingredients': 2,
+    'text': 1,
+}
+
+
+def normalize(text):
+    '''Приводит строку к виду для поиска без учета регистра и буквы ё.'''
+    return text.casefold().replace('ё', 'е').strip()
+
+
+def stem(word):
+    '''Упрощенный стемминг: отрезает самое длинное русское окончание,
+    оставляя основу не короче MIN_STEM букв.'''
+    for ending in ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= MIN_STEM:
+            return word[:-len(ending)]
+    return word
+
+
+def tokenize(text):
+    '''Основы слов строки text.'''
+    return [stem(word) for word in WORD.findall(normalize(text))]
+
+
+def ngrams(text, size=NGRAM):
+    '''Все различные подстроки text длиной от 1 до size символов.'''
+    return {text[start:start + length]
+            for length in range(1, size + 1)
+            for start in range(len(text) - length + 1)}
+
+
+class InMemoryIndex:
+    '''Индекс в памяти процесса.
+
+    Версия индекса хранится в общем кэше: изменение данных в любом
+    процессе меняет версию, и каждый процесс перестраивает свою копию
+    при следующем обращении.
+    '''
+    version_key = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+
+    def build(self):
+        raise NotImplementedError
+
+    def ensure_fresh(self):
+        version = get_version(self.version_key)
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self.build()
+                self._version = version
+
+    def invalidate(self):
+        bump_version(self.version_key)
+
+
+class IncrementalIndex(InMemoryIndex):
+    '''Индекс, догоняющий изменения по журналу в общем кэше.
+
+    Вместо версии хранит номер последнего примененного изменения и
+    обновляет только затронутые объекты. Если журнал недоступен
+    (вытеснен из кэша или слишком длинный), индекс строится заново.
+    '''
+
+    def refresh(self, ids):
+        raise NotImplementedError
+
+    def ensure_fresh(self):
+        sequence = get_sequence(self.version_key)
+        if sequence == self._version:
+            return
+        with self._lock:
+            if sequence == self._version:
+                return
+            changed = changes_between(self.version_key, self._version,
+                                      sequence)
+            if changed is None:
+                self.build()
+            elif changed:
+                self.refresh(changed)
+            self._version = sequence
+
+    def invalidate(self):
+        reset_changes(self.version_key)
+
+
+class IngredientIndex(InMemoryIndex):
+    '''Отсортированный индекс названий ингредиентов для автодополнения.
+
+    Хранит два отсортированных списка: полные названия и окончания
+    названий, начинающиеся с каждого следующего слова. Поиск по префиксу
+    выполняется бинарным поиском и не зависит от размера справочника.
+    Для вхождений в середину слова хранит позиции названий по каждой их
+    подстроке длиной до NGRAM: короткий запрос находится по ней сразу, а
+    для длинного проверяются только названия с самой редкой из его
+    подстрок длины NGRAM. Этот поиск идет, только если совпадений по
+    префиксу меньше limit.
+    '''
+    version_key = INGREDIENTS_VERSION
+
+    def __init__(self):
+        super().__init__()
+        self._entries = ([], [], {})
+
+    def build(self):
+        names, words = [], []
+        rows = Ingredient.objects.values_list('id', 'name').iterator()
+        for pk, name in rows:
+            key = normalize(name)
+            names.append((key, pk))
+            words.extend((key[match.start():], pk)
+                         for match in WORD_START.finditer(key))
+        names.sort()
+        words.sort()
+        grams = defaultdict(list)
+        for position, (key, _) in enumerate(names):
+            for gram in ngrams(key):
+                grams[gram].append(position)
+        self._entries = (names, words, dict(grams))
+
+    def containing(self, query):
+        '''Позиции в списке названий тех, что содержат query, по порядку.'''
+        names, _, grams = self._entries
+        if len(query) <= NGRAM:
+            return grams.get(query, ())
+        positions = min(
+            (grams.get(query[start:start + NGRAM], ())
+             for start in range(len(query) - NGRAM + 1)), key=len)
+        return (position for position in positions
+                if query in names[position][0])
+
+    def search(self, query, limit=AUTOCOMPLETE_LIMIT):
+        '''Id ингредиентов: сначала совпадения по началу названия,
+        затем по началу любого другого слова в названии, затем по
+        вхождению в любое место названия.'''
+        self.ensure_fresh()
+        query = normalize(query)
+        result = []
+        if not query:
+            return result
+        seen = set()
+        names, words, _ = self._entries
+        for entries in (names, words):
+            position = bisect_left(entries, (query,))
+            while (position < len(entries)
+                   and entries[position][0].startswith(query)):
+                pk = entries[position][1]
+                if pk not in seen:
+                    seen.add(pk)
+                    result.append(pk)
+                    if len(result) >= limit:
+                        return result
+                position += 1
+        for position in self.containing(query):
+            pk = names[position][1]
+            if pk not in seen:
+                seen.add(pk)
+                result.append(pk)
+                if len(result) >= limit:
+                    break
+        return result
+
+
+class RecipeSearchIndex(IncrementalIndex):
+    '''Инвертированный индекс рецептов для поиска без PostgreSQL.
+
+    Для каждой основы слова хранит вес совпадения в каждом рецепте:
+    слова названия весят больше слов из ингредиентов, а те больше слов
+    из описания. Догоняет изменения рецептов по журналу RECIPE_CHANGES,
+    подменяя копии затронутых списков, как RecipeIngredientIndex.
+    '''
+    version_key = RECIPE_CHANGES
+
+    def __init__(self):
+        super().__init__()
+        self._state = ({}, {})
+
+    def terms(self, recipe_ids=None):
+        '''Веса основ слов по рецептам: {id рецепта: {основа: вес}}.'''
+        terms = defaultdict(lambda: defaultdict(int))
+
+        def add(recipe_id, text, weight):
+            for term in tokenize(text):
+                terms[recipe_id][term] += weight
+
+        recipes = Recipe.objects.order_by()
+        ingredients = IngredientsInRecipe.objects.order_by()
+        if recipe_ids is not None:
+            recipes = recipes.filter(pk__in=recipe_ids)
+            ingredients = ingredients.filter(recipe_id__in=recipe_ids)
+        for pk, name, text in recipes.values_list(
+                'id', 'name', 'text').iterator():
+            add(pk, name, SEARCH_WEIGHTS['name'])
+            add(pk, text, SEARCH_WEIGHTS['text'])
+        for pk, name in ingredients.values_list(
+                'recipe_id', 'ingredient__name').iterator():
+            add(pk, name, SEARCH_WEIGHTS['ingredients'])
+        return {pk: dict(weights) for pk, weights in terms.items()}
+
+    def build(self):
+        recipes = self.terms()
+        postings = defaultdict(dict)
+        for pk, weights in recipes.items():
+            for term, weight in weights.items():
+                postings[term][pk] = weight
+        self._state = (recipes, dict(postings))
+
+    def refresh(self, ids):
+        recipes, postings = map(dict, self._state)
+        touched = {}
+        for pk in ids:
+            for term in recipes.pop(pk, ()):
+                touched.setdefault(term, dict(postings[term])).pop(pk, None)
+        for pk, weights in self.terms(ids).items():
+            recipes[pk] = weights
+            for term, weight in weights.items():
+                touched.setdefault(term, dict(postings.get(term, ())))[
+                    pk] = weight
+        for term, weights in touched.items():
+            if weights:
+                postings[term] = weights
+            else:
+                postings.pop(term, None)
+        self._state = (recipes, postings)
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        '''Пары (id рецепта, релевантность) для рецептов, содержащих все
+        слова запроса, по убыванию релевантности.'''
+        self.ensure_fresh()
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        index = self._state[1]
+        postings = sorted((index.get(term, {}) for term in terms), key=len)
+        scores = dict(postings[0])
+        for weights in postings[1:]:
+            scores = {pk: score + weights[pk]
+                      for pk, score in scores.items() if pk in weights}
+        return sorted(scores.items(),
+                      key=lambda item: (-item[1], -item[0]))[:limit]
+
+
+class RecipeIngredientIndex(IncrementalIndex):
+    '''Составы рецептов для подбора по имеющимся ингредиентам.
+
+    Хранит множество ингредиентов каждого рецепта и обратные списки
+    рецептов для каждого ингредиента. Совпадения считаются Counter по
+    спискам только имеющихся ингредиентов, без обхода всех рецептов.
+    Обновления не меняют структуры на месте, а подменяют их копии, так
+    что поиск в других потоках видит согласованный снимок.
+    '''
+    version_key = RECIPE_CHANGES
+
+    def __init__(self):
+        super().__init__()
+        self._state = ({}, {})
+
+    def rows(self, recipe_ids=None):
+        rows = IngredientsInRecipe.objects.order_by()
+        if recipe_ids is not None:
+            rows = rows.filter(recipe_id__in=recipe_ids)
+        return rows.values_list('recipe_id', 'ingredient_id').iterator()
+
+    def build(self):
+        recipes = defaultdict(set)
+        postings = defaultdict(set)
+        for recipe_id, ingredient_id in self.rows():
+            recipes[recipe_id].add(ingredient_id)
+            postings[ingredient_id].add(recipe_id)
+        self._state = (dict(recipes), dict(postings))
+
+    def refresh(self, ids):
+        recipes, postings = map(dict, self._state)
+        touched = {}
+        for recipe_id in ids:
+            for ingredient_id in recipes.pop(recipe_id, ()):
+                touched.setdefault(ingredient_id, set(
+                    postings[ingredient_id])).discard(recipe_id)
+        for recipe_id, ingredient_id in self.rows(ids):
+            recipes.setdefault(recipe_id, set()).add(ingredient_id)
+            touched.setdefault(ingredient_id, set(
+                postings.get(ingredient_id, ()))).add(recipe_id)
+        postings.update(touched)
+        self._state = (recipes, postings)
+
+    def match(self, ingredient_ids, limit=MATCH_LIMIT):
+        '''Тройки (id рецепта, доля имеющихся ингредиентов, сколько
+        не хватает) по убыванию доли, затем по числу недостающих.'''
+        self.ensure_fresh()
+        recipes, postings = self._state
+        matches = Counter()
+        for ingredient_id in set(ingredient_ids):
+            matches.update(postings.get(ingredient_id, ()))
+        ranked = heapq.nsmallest(limit, (
+            (-count / size, size - count, -pk)
+            for pk, count, size in (
+                (pk, count, len(recipes[pk]))
+                for pk, count in matches.items())))
+        return [(-pk, -coverage, missing)
+                for coverage, missing, pk in ranked]
+
+
+ingredient_index = IngredientIndex()
+recipe_search_index = RecipeSearchIndex()
+recipe_ingredient_index = RecipeIngredientIndex()
@@ -0,0 +1,25 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+
+from api.cache import (ANONYMOUS_OUTCOMES, anonymous_cache_stats,
+                       anonymous_stats_key)
+
+
+class Command(BaseCommand):
+    help = 'Показать счетчики кэша ответов для анонимных пользователей.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='Обнулить счетчики после вывода.')
+
+    def handle(self, *args, **options):
+        stats = anonymous_cache_stats()
+        total = sum(stats.values())
+        for outcome, count in stats.items():
+            share = count / total if total else 0
+            self.stdout.write(f'{outcome}: {count} ({share:.1%})')
+        if options['reset']:
+            cache.delete_many(
+                [anonymous_stats_key(outcome)
+                 for outcome in ANONYMOUS_OUTCOMES])
@@ -0,0 +1,93 @@
+import json
+import tempfile
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (override_settings, setup_test_environment,
+                               teardown_test_environment)
+
+from api.benchmarks import (Benchmark, Dataset, check_thresholds,
+                            make_thresholds)
+
+THRESHOLDS = settings.BASE_DIR / 'data' / 'benchmark_thresholds.json'
+
+
+class Command(BaseCommand):
+    help = ('Замерить количество SQL-запросов, задержки и память для '
+            'эндпоинтов API на синтетических данных в тестовой базе.')
+
+    def add_arguments(self, parser):
+        self.add_dataset_arguments(parser)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--only', nargs='*',
+                            help='Запустить только указанные сценарии.')
+        parser.add_argument('--output', help='Файл для JSON-отчета.')
+        parser.add_argument('--thresholds', default=THRESHOLDS,
+                            help='JSON-файл с порогами.')
+        parser.add_argument('--update-thresholds', action='store_true',
+                            help='Записать пороги по текущему прогону.')
+        parser.add_argument(
+            '--baseline',
+            help='JSON-отчет прогона на этой же машине; порог p95 '
+                 'считается от его задержек.')
+
+    def add_dataset_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20)
+        parser.add_argument('--recipes', type=int, default=200)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--tags', type=int, default=5)
+        parser.add_argument('--ingredients-per-recipe', type=int, default=8)
+        parser.add_argument('--follows', type=int, default=10)
+        parser.add_argument('--favorites', type=int, default=20)
+
+    def make_dataset(self, options):
+        return Dataset(
+            users=options['users'], recipes=options['recipes'],
+            ingredients=options['ingredients'], tags=options['tags'],
+            ingredients_per_recipe=options['ingredients_per_recipe'],
+            follows=options['follows'], favorites=options['favorites'])
+
+    def handle(self, *args, **options):
+        report = self.run_benchmark(
+            Benchmark(self.make_dataset(options), options['iterations']),
+            options['only'])
+        thresholds_path = Path(options['thresholds'])
+        if options['update_thresholds']:
+            thresholds_path.write_text(json.dumps(
+                make_thresholds(report), indent=2, ensure_ascii=False)
+                + '\n', encoding='utf-8')
+        elif thresholds_path.exists():
+            baseline = None
+            if options['baseline']:
+                baseline = json.loads(
+                    Path(options['baseline']).read_text(encoding='utf-8'))
+            report['failures'] = check_thresholds(
+                report,
+                json.loads(thresholds_path.read_text(encoding='utf-8')),
+                baseline)
+        content = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            Path(options['output']).write_text(content, encoding='utf-8')
+        else:
+            self.stdout.write(content)
+        if report.get('failures'):
+            raise CommandError(
+                'Ожидания не выполнены:\n' + '\n'.join(report['failures']))
+
+    def run_benchmark(self, benchmark, only):
+        '''Запуск на отдельной тестовой базе без миграций и с временной
+        папкой для медиафайлов.'''
+        setup_test_environment()
+        connection.settings_dict['TEST']['MIGRATE'] = False
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True,
+                                           serialize=False)
+        try:
+            with tempfile.TemporaryDirectory() as media_root:
+                with override_settings(MEDIA_ROOT=media_root):
+                    return benchmark.run(only)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
@@ -0,0 +1,38 @@
+import json
+from pathlib import Path
+
+from api.benchmarks import ConcurrencyBenchmark
+
+from .benchmark_api import Command as BenchmarkCommand
+
+
+class Command(BenchmarkCommand):
+    help = ('Сравнить пропускную способность синхронных и асинхронных '
+            'эндпоинтов чтения при множестве одновременных клиентов.')
+
+    def add_arguments(self, parser):
+        self.add_dataset_arguments(parser)
+        parser.add_argument('--requests', type=int, default=200,
+                            help='Запросов к каждому эндпоинту.')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Одновременных клиентов.')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Синхронных воркеров на один асинхронный '
+                                 'процесс.')
+        parser.add_argument('--db-latency-ms', type=float, default=5,
+                            help='Задержка базы на каждый SQL-запрос.')
+        parser.add_argument('--only', nargs='*',
+                            help='Замерить только указанные эндпоинты.')
+        parser.add_argument('--output', help='Файл для JSON-отчета.')
+
+    def handle(self, *args, **options):
+        benchmark = ConcurrencyBenchmark(
+            self.make_dataset(options), requests=options['requests'],
+            concurrency=options['concurrency'], workers=options['workers'],
+            db_latency_ms=options['db_latency_ms'])
+        report = self.run_benchmark(benchmark, options['only'])
+        content = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            Path(options['output']).write_text(content, encoding='utf-8')
+        else:
+            self.stdout.write(content)
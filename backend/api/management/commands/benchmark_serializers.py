@@ -0,0 +1,36 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import CommandError
+
+from api.benchmarks import SerializationBenchmark
+
+from .benchmark_api import Command as BenchmarkCommand
+
+
+class Command(BenchmarkCommand):
+    help = ('Сравнить скорость сериализации и рендеринга страниц чтения '
+            'через поля DRF и через ручные to_representation.')
+
+    def add_arguments(self, parser):
+        self.add_dataset_arguments(parser)
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--only', nargs='*',
+                            help='Замерить только указанные страницы.')
+        parser.add_argument('--output', help='Файл для JSON-отчета.')
+
+    def handle(self, *args, **options):
+        report = self.run_benchmark(
+            SerializationBenchmark(self.make_dataset(options),
+                                   options['iterations']),
+            options['only'])
+        content = json.dumps(report, indent=2, ensure_ascii=False)
+        if options['output']:
+            Path(options['output']).write_text(content, encoding='utf-8')
+        else:
+            self.stdout.write(content)
+        different = [name for name, result in report['results'].items()
+                     if not result['identical']]
+        if different:
+            raise CommandError(
+                'Ответы отличаются: ' + ', '.join(different))
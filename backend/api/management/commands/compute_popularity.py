@@ -0,0 +1,60 @@
+import heapq
+from collections import defaultdict
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from api.models import Favourite, RecipePopularity, ShoppingCart
+
+EVENT_WEIGHTS = (
+    (Favourite, 1.0),
+    (ShoppingCart, 2.0),
+)
+
+
+class Command(BaseCommand):
+    help = ('Пересчитать рейтинг популярности рецептов по добавлениям в '
+            'избранное и корзину с затуханием по времени.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=7,
+            help='Учитывать события за последние N дней.')
+        parser.add_argument(
+            '--half-life', type=float, default=48,
+            help='Период полураспада веса события в часах.')
+        parser.add_argument(
+            '--limit', type=int, default=1000,
+            help='Сколько лучших рецептов сохранить в рейтинге.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одной вставке.')
+
+    def handle(self, *args, **options):
+        for option in ('days', 'half_life', 'limit', 'batch_size'):
+            if options[option] <= 0:
+                raise CommandError(
+                    f'--{option.replace("_", "-")} должен быть больше нуля.')
+        now = timezone.now()
+        since = now - timedelta(days=options['days'])
+        half_life = timedelta(hours=options['half_life']).total_seconds()
+        scores = defaultdict(float)
+        for model, weight in EVENT_WEIGHTS:
+            events = model.objects.filter(added_at__gte=since).order_by()
+            for recipe_id, added_at in events.values_list(
+                    'recipe_id', 'added_at').iterator():
+                age = (now - added_at).total_seconds()
+                scores[recipe_id] += weight * 0.5 ** (age / half_life)
+        ranked = heapq.nlargest(options['limit'], scores.items(),
+                                key=lambda item: item[1])
+        with transaction.atomic():
+            RecipePopularity.objects.all().delete()
+            RecipePopularity.objects.bulk_create(
+                (RecipePopularity(recipe_id=recipe_id, score=score,
+                                  computed_at=now)
+                 for recipe_id, score in ranked),
+                batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Рейтинг пересчитан, рецептов: {len(ranked)}.'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.images import generate_variants, variants_ready
+from api.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Создать недостающие уменьшенные копии картинок рецептов '
+            'и отметить рецепты, у которых копии готовы.')
+
+    def handle(self, *args, **options):
+        images = created = marked = failed = 0
+        names = (Recipe.objects.exclude(image='').order_by()
+                 .values_list('image', flat=True).distinct())
+        for name in names.iterator():
+            images += 1
+            count = generate_variants(name, Recipe.image.field.storage)
+            if count is None:
+                failed += 1
+                continue
+            created += count
+            marked += variants_ready(name)
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено картинок: {images}, создано копий: {created}, '
+            f'отмечено рецептов: {marked}, ошибок: {failed}.'))
@@ -1,20 +1,115 @@
 import csv
+import json
+import re
+import time
+from itertools import islice
+from pathlib import Path
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
+from api.cache import INGREDIENTS_VERSION, bump_version
 from api.models import Ingredient
 
+READ_SIZE = 64 * 1024
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+def read_csv(file):
+    '''Построчно читает CSV вида "название,единица измерения".'''
+    reader = csv.reader(file)
+    try:
+        for row in reader:
+            if not row:
+                continue
+            if len(row) != 2:
+                raise CommandError(
+                    f'Строка {reader.line_num}: ожидается два поля '
+                    f'(название и единица измерения), получено {len(row)}.')
+            name, unit = row
+            yield name, unit
+    except csv.Error as error:
+        raise CommandError(f'Строка {reader.line_num}: {error}.')
+
+
+def read_json(file):
+    '''Потоково читает JSON-массив объектов с name и measurement_unit.'''
+    decoder = json.JSONDecoder()
+    buffer = file.read(READ_SIZE).lstrip()
+    if not buffer.startswith('['):
+        raise CommandError('Ожидается JSON-массив ингредиентов.')
+    position = 1
+    number = 0
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(READ_SIZE)
+            if not chunk:
+                raise CommandError('Некорректный JSON-файл.')
+            buffer, position = buffer[position:] + chunk, 0
+            continue
+        number += 1
+        try:
+            name, unit = item['name'], item['measurement_unit']
+        except (KeyError, TypeError):
+            raise CommandError(
+                f'Элемент {number}: ожидается объект с полями name и '
+                f'measurement_unit.')
+        yield name, unit
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
 
 class Command(BaseCommand):
-    help = ' Загрузить ингредиенты в базу.'
-
-    def handle(self, *args, **kwargs):
-        path = settings.BASE_DIR
-        with open(f'{path}/data/ingredients.csv', 'r',
-                  encoding='utf-8') as file:
-            file_reader = csv.reader(file)
-            for row in file_reader:
-                name, unit = row
-                Ingredient.objects.get_or_create(name=name,
-                                                 measurement_unit=unit)
+    help = 'Загрузить ингредиенты в базу из CSV или JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=settings.BASE_DIR / 'data' / 'ingredients.csv',
+            help='Путь к файлу .csv или .json.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одной вставке.')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        batch_size = options['batch_size']
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError('Поддерживаются только файлы .csv и .json.')
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        before = Ingredient.objects.count()
+        total = 0
+        start = time.monotonic()
+        with open(path, encoding='utf-8') as file:
+            rows = reader(file)
+            while True:
+                batch = list(islice(rows, batch_size))
+                if not batch:
+                    break
+                Ingredient.objects.bulk_create(
+                    (Ingredient(name=name, measurement_unit=unit)
+                     for name, unit in batch),
+                    ignore_conflicts=True)
+                total += len(batch)
+                if options['verbosity'] > 1:
+                    self.stdout.write(f'Обработано строк: {total}')
+        elapsed = time.monotonic() - start
+        inserted = Ingredient.objects.count() - before
+        if inserted:
+            bump_version(INGREDIENTS_VERSION)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано строк: {total}, добавлено: {inserted}, '
+            f'пропущено: {total - inserted}, '
+            f'{total / elapsed if elapsed else total:.0f} строк/с '
+            f'({elapsed:.2f} с).'))
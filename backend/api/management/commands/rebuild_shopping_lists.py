@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api import shopping_list
+from api.exports import invalidate_shopping_cart
+from api.models import ShoppingCart, ShoppingListItem
+
+
+class Command(BaseCommand):
+    help = 'Пересобрать списки покупок пользователей по их корзинам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, action='append', dest='users',
+            help='id пользователя; можно указать несколько раз.')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество строк в одной вставке.')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        users = options['users']
+        with transaction.atomic():
+            if users is None:
+                users = set(ShoppingCart.objects.values_list(
+                    'user_id', flat=True)) | set(
+                    ShoppingListItem.objects.values_list(
+                        'user_id', flat=True))
+                total = shopping_list.rebuild(
+                    batch_size=options['batch_size'])
+            else:
+                total = shopping_list.rebuild(users, options['batch_size'])
+        for user_id in users:
+            invalidate_shopping_cart(user_id)
+        self.stdout.write(self.style.SUCCESS(
+            f'Списки покупок пересобраны, строк: {total}.'))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from api.models import Favourite, Recipe, ShoppingCart, User
+
+
+def count_of(model, field):
+    '''Подзапрос с количеством строк model, ссылающихся на внешний объект.'''
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by()
+        .values(field).annotate(count=Count('pk')).values('count'),
+        output_field=IntegerField()), 0)
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать счетчики избранного, корзин и рецептов.'
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        counters = (
+            (Recipe, 'favorites_count', count_of(Favourite, 'recipe')),
+            (Recipe, 'in_carts_count', count_of(ShoppingCart, 'recipe')),
+            (User, 'recipes_count', count_of(Recipe, 'author')),
+        )
+        for model, field, actual in counters:
+            fixed = model.objects.exclude(**{field: actual}).update(
+                **{field: actual})
+            self.stdout.write(
+                f'{model._meta.verbose_name_plural}.{field}: '
+                f'исправлено {fixed}')
+        self.stdout.write(self.style.SUCCESS('Счетчики пересчитаны.'))
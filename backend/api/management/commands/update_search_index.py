@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.cache import RECIPES_VERSION, bump_version
+from api.indexes import recipe_search_index
+from api.models import Recipe
+from api.search import is_postgres, update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Пересчитать поисковые векторы всех рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Количество рецептов в одной пачке.')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size должен быть больше нуля.')
+        total = 0
+        if is_postgres():
+            ids = list(Recipe.objects.values_list('id', flat=True))
+            for start in range(0, len(ids), batch_size):
+                update_search_vectors(ids[start:start + batch_size])
+            total = len(ids)
+        else:
+            recipe_search_index.invalidate()
+        bump_version(RECIPES_VERSION)
+        self.stdout.write(self.style.SUCCESS(
+            f'Поисковый индекс обновлен, рецептов: {total}.'))
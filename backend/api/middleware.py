@@ -0,0 +1,114 @@
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+logger = logging.getLogger('foodgram.sql')
+
+PLACEHOLDER_LISTS = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+TOP_QUERIES = 3
+
+
+def fingerprint(sql):
+    '''SQL без значений: одинаковые по форме запросы дают один отпечаток.'''
+    return LITERALS.sub('?', PLACEHOLDER_LISTS.sub('(...)', sql))
+
+
+def view_name(request):
+    '''Имя обработчика запроса, например RecipeViewSet.list.'''
+    match = request.resolver_match
+    if match is None:
+        return request.path
+    view = match.func
+    view_class = getattr(view, 'cls', None) or getattr(
+        view, 'view_class', None)
+    if view_class is None:
+        return match.view_name
+    actions = getattr(view, 'actions', None) or {}
+    handler = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{handler}'
+
+
+class QueryRecorder:
+    '''Обертка execute_wrapper, считающая запросы и время в базе.'''
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def repeated(self):
+        return [{'sql': sql, 'count': count}
+                for sql, count in self.fingerprints.most_common(TOP_QUERIES)
+                if count > 1]
+
+
+class SQLProfilingMiddleware:
+    '''Профилирование SQL для выборки запросов.
+
+    Включается настройкой SQL_PROFILING. Время измеряется у каждого
+    запроса, и все запросы дольше SQL_PROFILING_SLOW_REQUEST_MS пишутся в
+    лог foodgram.sql. SQL перехватывается только у доли запросов
+    SQL_PROFILING_SAMPLE_RATE: для них добавляется заголовок Server-Timing,
+    а в лог попадают время в базе и повторяющиеся SQL.
+    '''
+
+    def __init__(self, get_response):
+        if not settings.SQL_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = settings.SQL_PROFILING_SAMPLE_RATE
+        self.slow_request_ms = settings.SQL_PROFILING_SLOW_REQUEST_MS
+
+    def __call__(self, request):
+        recorder = None
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            if random.random() < self.sample_rate:
+                recorder = QueryRecorder()
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total_ms = (time.perf_counter() - start) * 1000
+        if recorder is not None:
+            response['Server-Timing'] = (
+                f'db;dur={recorder.duration * 1000:.1f};'
+                f'desc="{recorder.count} queries", '
+                f'total;dur={total_ms:.1f}')
+        if total_ms >= self.slow_request_ms:
+            self.log_slow(request, response, total_ms, recorder)
+        return response
+
+    def log_slow(self, request, response, total_ms, recorder):
+        '''Записать медленный запрос в лог; SQL есть только в выборке.'''
+        entry = {
+            'view': view_name(request),
+            'method': request.method,
+            'path': request.get_full_path(),
+            'status': response.status_code,
+            'total_ms': round(total_ms, 1),
+            'sampled': recorder is not None,
+        }
+        if recorder is not None:
+            entry.update(db_ms=round(recorder.duration * 1000, 1),
+                         queries=recorder.count,
+                         repeated=recorder.repeated())
+        logger.warning(json.dumps(entry, ensure_ascii=False),
+                       extra={'sql_profile': entry})
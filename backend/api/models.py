@@ -1,10 +1,50 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core import validators
 from django.db import models
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from users.models import CountersMixin
 
 User = get_user_model()
 
 
+class AddedAtField(models.DateTimeField):
+    '''Время добавления, которое ставится при вставке строки.
+
+    В отличие от default=timezone.now, строки, добавленные до появления
+    поля, остаются с NULL, а не получают время миграции.
+    '''
+
+    def pre_save(self, model_instance, add):
+        if add and getattr(model_instance, self.attname) is None:
+            setattr(model_instance, self.attname, timezone.now())
+        return super().pre_save(model_instance, add)
+
+
+class PostgresOnlyGinIndex(GinIndex):
+    '''GIN-индекс, который создается только в PostgreSQL.
+
+    В других базах миграция с ним проходит без SQL. Индекс создается
+    с IF NOT EXISTS: раньше его создавал обработчик post_migrate.
+    '''
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return ''
+        statement = super().create_sql(model, schema_editor, using, **kwargs)
+        statement.template = statement.template.replace(
+            'CREATE INDEX ', 'CREATE INDEX IF NOT EXISTS ', 1)
+        return statement
+
+    def remove_sql(self, model, schema_editor, **kwargs):
+        if schema_editor.connection.vendor != 'postgresql':
+            return ''
+        return super().remove_sql(model, schema_editor, **kwargs)
+
+
 class Ingredient(models.Model):
     ''' Модель ингредиента. '''
     name = models.CharField(
@@ -50,7 +90,21 @@ class Tag(models.Model):
         return self.name
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    '''Запросы к рецептам.'''
+
+    def for_read(self):
+        '''Рецепты со всеми связями для чтения.
+
+        Флаги пользователя сериализаторы берут из api.relations.
+        '''
+        return self.defer('search_vector').prefetch_related(
+            'tags', 'author',
+            Prefetch('recipe', queryset=IngredientsInRecipe.objects
+                     .select_related('ingredient')))
+
+
+class Recipe(CountersMixin, models.Model):
     '''Модель рецепта.'''
     author = models.ForeignKey(
         User,
@@ -80,14 +134,46 @@ class Recipe(models.Model):
         validators=(
             validators.MinValueValidator(
                 1, message='Минимальное время приготовления 1 минута'),),)
+    servings = models.PositiveSmallIntegerField(
+        verbose_name='Количество порций',
+        default=1,
+        validators=(
+            validators.MinValueValidator(
+                1, message='Минимальное количество порций 1'),),)
     pub_date = models.DateTimeField(
         verbose_name='Дата публикации',
         auto_now_add=True)
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Количество в избранном',
+        default=0,
+        db_index=True)
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='Количество в корзинах',
+        default=0,
+        db_index=True)
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False)
+    variants_image = models.CharField(
+        verbose_name='Картинка с готовыми копиями',
+        max_length=100,
+        blank=True,
+        default='',
+        editable=False)
+
+    counter_fields = ('favorites_count', 'in_carts_count', 'variants_image')
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(fields=['author', '-id'],
+                         name='recipe_author_id_idx'),
+            PostgresOnlyGinIndex(fields=['search_vector'],
+                                 name='api_recipe_search_vector_gin')]
 
     def __str__(self):
         return self.name
@@ -133,6 +219,11 @@ class Favourite(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Рецепт',
         related_name='favorites')
+    added_at = AddedAtField(
+        verbose_name='Дата добавления',
+        null=True,
+        blank=True,
+        db_index=True)
 
     class Meta:
         verbose_name = 'Избранный рецепт'
@@ -155,6 +246,19 @@ class ShoppingCart(models.Model):
         on_delete=models.CASCADE,
         verbose_name='Рецепт',
         related_name='shopping_cart')
+    added_at = AddedAtField(
+        verbose_name='Дата добавления',
+        null=True,
+        blank=True,
+        db_index=True)
+    servings = models.PositiveSmallIntegerField(
+        verbose_name='Количество порций',
+        help_text='Пусто - как в рецепте',
+        null=True,
+        blank=True,
+        validators=(
+            validators.MinValueValidator(
+                1, message='Минимальное количество порций 1'),),)
 
     class Meta:
         ordering = ['-id']
@@ -163,3 +267,53 @@ class ShoppingCart(models.Model):
         constraints = [
             models.UniqueConstraint(fields=['user', 'recipe'],
                                     name='unique_shopping_cart')]
+
+
+class ShoppingListItem(models.Model):
+    '''Суммарное количество ингредиента в корзине пользователя.
+
+    Поддерживается сигналами при изменении корзин, состава и порций
+    рецептов (см. api/signals.py и api/shopping_list.py), пересобирается
+    командой rebuild_shopping_lists.
+    '''
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь',
+        related_name='shopping_list')
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+        related_name='shopping_list')
+    amount = models.FloatField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'ingredient'],
+                                    name='unique_shopping_list_item')]
+
+
+class RecipePopularity(models.Model):
+    '''Рейтинг популярности рецепта с затуханием по времени.
+
+    Пересчитывается командой compute_popularity.
+    '''
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Рецепт',
+        related_name='popularity')
+    score = models.FloatField(
+        verbose_name='Рейтинг',
+        db_index=True)
+    computed_at = models.DateTimeField(
+        verbose_name='Дата расчета')
+
+    class Meta:
+        ordering = ['-score']
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
@@ -1,6 +1,93 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import InvalidPage
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+    async def apaginate_queryset(self, queryset, request):
+        '''paginate_queryset для асинхронных представлений: количество и
+        страница читаются через асинхронный ORM.'''
+        self.request = request
+        paginator = self.django_paginator_class(
+            queryset, self.get_page_size(request))
+        paginator.count = await queryset.acount()
+        page_number = self.get_page_number(request, paginator)
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=page_number, message=str(exc)))
+        return [item async for item in self.page.object_list]
+
+
+class KeysetPagination(CursorPagination):
+    '''Пагинация по курсору: страница ищется по ключу сортировки queryset,
+    без OFFSET и подсчета всех строк.
+
+    Позиция курсора - первое поле сортировки, поэтому оно должно быть
+    уникальным (см. supports).
+    '''
+    page_size = 6
+    page_size_query_param = 'limit'
+    count_query_param = 'count'
+    unique_fields = ('id', 'pk')
+
+    @staticmethod
+    def ordering_of(queryset):
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        return tuple(field for field in ordering if isinstance(field, str))
+
+    @classmethod
+    def supports(cls, queryset):
+        '''Сортирован ли queryset по уникальному полю. При повторяющихся
+        значениях первого поля курсор пропускал бы или повторял строки.'''
+        ordering = cls.ordering_of(queryset)
+        return bool(ordering) and ordering[0].lstrip('-') in cls.unique_fields
+
+    def get_ordering(self, request, queryset, view):
+        return self.ordering_of(queryset)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) in ('1', 'true'):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data = {'count': self.count, **response.data}
+        return response
+
+
+class FeedPagination(LimitPageNumberPagination):
+    '''Постраничная пагинация с режимом курсора.
+
+    Режим курсора включается параметром ?pagination=cursor и сохраняется
+    в ссылках next/previous. Общее количество в этом режиме возвращается
+    только по запросу ?count=true. Сортировки не по id (популярность,
+    релевантность поиска, ?ordering=favorites_count) всегда отдаются
+    постранично: их первое поле не уникально.
+    '''
+    mode_query_param = 'pagination'
+    keyset_class = KeysetPagination
+
+    def __init__(self):
+        self.keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        params = request.query_params
+        if ((params.get(self.mode_query_param) == 'cursor'
+                or self.keyset_class.cursor_query_param in params)
+                and self.keyset_class.supports(queryset)):
+            self.keyset = self.keyset_class()
+            return self.keyset.paginate_queryset(queryset, request, view)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
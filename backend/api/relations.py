@@ -0,0 +1,66 @@
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import connection, transaction
+
+from users.models import Follow
+
+from .cache import bump_version, get_version
+from .models import Favourite, ShoppingCart
+
+RELATIONS_TIMEOUT = 60 * 60
+REQUEST_ATTRIBUTE = '_user_relations'
+
+Relations = namedtuple('Relations', ('favorites', 'cart', 'following'))
+
+EMPTY = Relations(frozenset(), frozenset(), frozenset())
+
+
+def relations_version_key(user_id):
+    return f'relations_version:{user_id}'
+
+
+def load_relations(user_id):
+    '''Id рецептов в избранном и корзине и id авторов в подписках.'''
+    return Relations(
+        frozenset(Favourite.objects.filter(user=user_id).order_by()
+                  .values_list('recipe_id', flat=True)),
+        frozenset(ShoppingCart.objects.filter(user=user_id).order_by()
+                  .values_list('recipe_id', flat=True)),
+        frozenset(Follow.objects.filter(user=user_id).order_by()
+                  .values_list('author_id', flat=True)))
+
+
+def get_relations(user_id):
+    '''Связи пользователя из кэша под его текущей версией.
+
+    Внутри транзакции связи читаются из базы: в ней могут быть еще не
+    закоммиченные изменения, которых нет в кэше.
+    '''
+    if connection.in_atomic_block:
+        return load_relations(user_id)
+    key = f'relations:{user_id}:{get_version(relations_version_key(user_id))}'
+    relations = cache.get(key)
+    if relations is None:
+        relations = load_relations(user_id)
+        cache.set(key, relations, RELATIONS_TIMEOUT)
+    return relations
+
+
+def user_relations(request):
+    '''Связи пользователя запроса, загружаемые один раз на запрос.'''
+    if request is None or not request.user.is_authenticated:
+        return EMPTY
+    relations = getattr(request, REQUEST_ATTRIBUTE, None)
+    if relations is None:
+        relations = get_relations(request.user.pk)
+        setattr(request, REQUEST_ATTRIBUTE, relations)
+    return relations
+
+
+def relations_changed(user_ids):
+    '''Сменить версию связей пользователей после коммита.'''
+    for user_id in set(user_ids):
+        transaction.on_commit(
+            lambda user_id=user_id: bump_version(
+                relations_version_key(user_id)))
@@ -0,0 +1,84 @@
+import json
+import re
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+FLOAT_EXPONENT = re.compile(rb'e-?\d+[,\]}]')
+SMALL_FLOAT = b'0.0000'
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'),
+                   (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+def json_float_differs(content):
+    '''Есть ли в выводе orjson число, которое json записал бы иначе.
+
+    json пишет с экспонентой числа меньше 1e-4 и от 1e16, а orjson
+    пишет такие числа с нулями после точки или с экспонентой без "+".
+    '''
+    return SMALL_FLOAT in content or any(
+        content[match.start() - 1:match.start()].isdigit()
+        for match in FLOAT_EXPONENT.finditer(content))
+
+
+class FastJSONRenderer(JSONRenderer):
+    '''JSONRenderer на orjson, если он установлен.
+
+    Ответ совпадает с JSONRenderer побайтно. Отступы, ASCII-вывод и
+    не компактный JSON отдаются обычному json, как и данные, которые
+    orjson не умеет кодировать, и очень большие или маленькие числа с
+    плавающей точкой, которые json пишет с экспонентой, а orjson иначе.
+    Единственное отличие - NaN и бесконечность: вместо ошибки STRICT_JSON
+    orjson пишет null.
+    '''
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii
+                or not self.compact or self.get_indent(
+                    accepted_media_type, renderer_context or {})):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        try:
+            content = orjson.dumps(data, default=self.encoder_class().default,
+                                   option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            content = None
+        if content is None or json_float_differs(content):
+            return super().render(data, accepted_media_type,
+                                  renderer_context)
+        for separator, escaped in LINE_SEPARATORS:
+            if separator in content:
+                content = content.replace(separator, escaped)
+        return content
+
+
+class ExportRenderer(BaseRenderer):
+    '''Рендерер для выгрузки файлов: отдает байты как есть.'''
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, bytes):
+            return data
+        if isinstance(data, (dict, list)):
+            return json.dumps(data, ensure_ascii=False).encode('utf-8')
+        return str(data).encode('utf-8')
+
+
+class PDFRenderer(ExportRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class TXTRenderer(ExportRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+
+class CSVRenderer(ExportRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
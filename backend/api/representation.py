@@ -0,0 +1,89 @@
+from functools import cached_property
+from operator import attrgetter
+
+from rest_framework.fields import (BooleanField, CharField, FileField,
+                                   IntegerField, ReadOnlyField,
+                                   SerializerMethodField)
+from rest_framework.settings import api_settings
+
+from .images import file_url
+
+PLAIN_FIELDS = (ReadOnlyField, CharField, IntegerField, BooleanField)
+METHOD, PLAIN, FILE, FIELD = 'method', 'plain', 'file', 'field'
+
+field_plans = {}
+
+
+def field_kind(field):
+    '''Способ чтения поля и его данные: имя метода или функция чтения
+    атрибута по source.
+
+    Значения полей PLAIN_FIELDS берутся как есть: их to_representation
+    не меняет уже готовые строки, числа и флаги модели.
+    '''
+    if isinstance(field, SerializerMethodField):
+        return METHOD, field.method_name
+    if field.source == '*':
+        return FIELD, None
+    get = attrgetter(field.source)
+    if isinstance(field, PLAIN_FIELDS):
+        return PLAIN, get
+    if (isinstance(field, FileField)
+            and getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL)
+            and not getattr(field, 'represent_in_base64', False)):
+        return FILE, get
+    return FIELD, get
+
+
+def field_plan(serializer_class):
+    '''Поля ответа сериализатора: тройки (имя, способ чтения, данные).
+
+    Считается один раз на класс по его объявленным полям и Meta.fields:
+    построение self.fields у ModelSerializer дороже самой сериализации.
+    '''
+    plan = field_plans.get(serializer_class)
+    if plan is None:
+        plan = field_plans[serializer_class] = [
+            (field.field_name, *field_kind(field))
+            for field in serializer_class()._readable_fields]
+    return plan
+
+
+def nested_reader(field, get):
+    if get is None:
+        return field.to_representation
+
+    def read(instance):
+        value = get(instance)
+        return None if value is None else field.to_representation(value)
+    return read
+
+
+class FastRepresentationMixin:
+    '''to_representation без обхода полей DRF.
+
+    Ключи и порядок берутся из тех же объявленных полей и Meta.fields, по
+    которым строится схема API, поэтому ответ не может разойтись с ее
+    описанием. Вложенные сериализаторы и прочие поля строятся как обычно,
+    а методы, простые атрибуты и ссылки на файлы читаются напрямую.
+    '''
+
+    @cached_property
+    def _readers(self):
+        request = self.context.get('request')
+        readers = []
+        for name, kind, data in field_plan(type(self)):
+            if kind == METHOD:
+                read = getattr(self, data)
+            elif kind == PLAIN:
+                read = data
+            elif kind == FILE:
+                def read(instance, get=data):
+                    return file_url(get(instance), request)
+            else:
+                read = nested_reader(self.fields[name], data)
+            readers.append((name, read))
+        return readers
+
+    def to_representation(self, instance):
+        return {name: read(instance) for name, read in self._readers}
@@ -0,0 +1,52 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connections
+from django.db.models import (Case, F, FloatField, OuterRef, Subquery,
+                              TextField, Value, When)
+
+from .indexes import recipe_search_index
+from .models import IngredientsInRecipe, Recipe
+
+SEARCH_CONFIG = 'russian'
+
+
+def is_postgres(using='default'):
+    return connections[using].vendor == 'postgresql'
+
+
+def update_search_vectors(recipe_ids):
+    '''Пересчитать поисковые векторы рецептов в PostgreSQL одним UPDATE.'''
+    if not recipe_ids or not is_postgres():
+        return
+    ingredient_names = IngredientsInRecipe.objects.filter(
+        recipe=OuterRef('pk')).order_by().values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')).values('names')
+    Recipe.objects.filter(pk__in=recipe_ids).update(search_vector=(
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Subquery(ingredient_names, output_field=TextField()),
+                       weight='B', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)))
+
+
+def search_recipes(queryset, query):
+    '''Рецепты, подходящие под запрос, с релевантностью search_rank,
+    отсортированные по ней.
+
+    В PostgreSQL ищет по полю search_vector с GIN-индексом, в остальных
+    базах по инвертированному индексу в памяти процесса.
+    '''
+    if is_postgres(queryset.db):
+        search_query = SearchQuery(query, config=SEARCH_CONFIG,
+                                   search_type='websearch')
+        return queryset.filter(search_vector=search_query).annotate(
+            search_rank=SearchRank(F('search_vector'), search_query)
+        ).order_by('-search_rank', '-id')
+    ranked = recipe_search_index.search(query)
+    if not ranked:
+        return queryset.none()
+    return queryset.filter(pk__in=[pk for pk, _ in ranked]).annotate(
+        search_rank=Case(
+            *(When(pk=pk, then=Value(float(score))) for pk, score in ranked),
+            output_field=FloatField())
+    ).order_by('-search_rank', '-id')
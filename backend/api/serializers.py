@@ -1,18 +1,25 @@
 from django.db import transaction
-from django.db.models import Count
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework.exceptions import ValidationError
-from rest_framework.fields import (IntegerField, ReadOnlyField,
+from rest_framework.fields import (IntegerField, ListField, ReadOnlyField,
                                    SerializerMethodField)
-from rest_framework.relations import PrimaryKeyRelatedField
-from rest_framework.serializers import ModelSerializer
+from rest_framework.serializers import ModelSerializer, Serializer
 
 from users.serializers import CustomUserSerializer
 
+from .images import RecipeImageField, schedule_variants, variant_urls
 from .models import Ingredient, IngredientsInRecipe, Recipe, Tag
+from .relations import user_relations
+from .representation import FastRepresentationMixin
+from .shopping_list import recipe_items_changed
 
+MAX_AMOUNT = 32767
+MAX_BULK_RECIPES = 100
+MAX_OWNED_INGREDIENTS = 200
+MAX_SERVINGS = 100
 
-class TagSerializer(ModelSerializer):
+
+class TagSerializer(FastRepresentationMixin, ModelSerializer):
     '''Сериализатор показа Тегов.'''
     class Meta:
         model = Tag
@@ -26,7 +33,8 @@ class IngredientSerializer(ModelSerializer):
         fields = '__all__'
 
 
-class IngredientsInRecipeSerializer(ModelSerializer):
+class IngredientsInRecipeSerializer(FastRepresentationMixin,
+                                    ModelSerializer):
     '''Сериализатор, соединяющий ингредиенты и рецепты.'''
     id = ReadOnlyField(source='ingredient.id')
     name = ReadOnlyField(source='ingredient.name')
@@ -40,12 +48,33 @@ class IngredientsInRecipeSerializer(ModelSerializer):
                   'amount')
 
 
-class ReadRecipeSerializer(ModelSerializer):
+class ShoppingListItemSerializer(Serializer):
+    '''Сериализатор строки списка покупок.'''
+    name = ReadOnlyField()
+    measurement_unit = ReadOnlyField()
+    amount = ReadOnlyField()
+
+
+class CartServingsSerializer(Serializer):
+    '''Количество порций рецепта в корзине.'''
+    servings = IntegerField(min_value=1, max_value=MAX_SERVINGS,
+                            required=False, allow_null=True)
+
+
+class RecipesLimitSerializer(Serializer):
+    '''Параметр recipes_limit: сколько рецептов автора показать в
+    подписке.'''
+    recipes_limit = IntegerField(min_value=0, required=False)
+
+
+class ReadRecipeSerializer(FastRepresentationMixin, ModelSerializer):
     '''Сериализатор для чтения рецептов (GET).'''
     tags = TagSerializer(read_only=True, many=True)
-    ingredients = SerializerMethodField()
+    ingredients = IngredientsInRecipeSerializer(source='recipe', many=True,
+                                                read_only=True)
     author = CustomUserSerializer(read_only=True)
     image = Base64ImageField()
+    image_variants = SerializerMethodField()
     is_favorited = SerializerMethodField(read_only=True)
     is_in_shopping_cart = SerializerMethodField(read_only=True)
 
@@ -59,29 +88,44 @@ class ReadRecipeSerializer(ModelSerializer):
                   'is_in_shopping_cart',
                   'name',
                   'image',
+                  'image_variants',
                   'text',
-                  'cooking_time')
+                  'cooking_time',
+                  'servings')
 
-    def get_ingredients(self, obj):
-        ingredients = IngredientsInRecipe.objects.filter(recipe=obj)
-        return IngredientsInRecipeSerializer(ingredients, many=True).data
+    def get_image_variants(self, obj):
+        return variant_urls(obj, self.context.get('request'))
 
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user.id
-        return Recipe.objects.filter(favorites__user=user,
-                                     id=obj.id).exists()
+        return obj.id in user_relations(self.context.get('request')).favorites
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user.id
-        return Recipe.objects.filter(shopping_cart__user=user,
-                                     id=obj.id).exists()
+        return obj.id in user_relations(self.context.get('request')).cart
+
+
+class MatchedRecipeSerializer(ReadRecipeSerializer):
+    '''Рецепт, подобранный по имеющимся ингредиентам.'''
+    coverage = ReadOnlyField()
+    missing = ReadOnlyField()
+
+    class Meta(ReadRecipeSerializer.Meta):
+        fields = ReadRecipeSerializer.Meta.fields + ('coverage', 'missing')
+
+
+class OwnedIngredientsSerializer(Serializer):
+    '''Id ингредиентов, которые есть у пользователя.'''
+    ingredients = ListField(child=IntegerField(min_value=1),
+                            allow_empty=False,
+                            max_length=MAX_OWNED_INGREDIENTS)
 
 
 class AddIngredientInRecipeSerializer(ModelSerializer):
     '''Сериализатор для добавления ингредиента.'''
 
     id = IntegerField()
-    amount = IntegerField()
+    amount = IntegerField(
+        min_value=1, max_value=MAX_AMOUNT,
+        error_messages={'min_value': 'Количество не может быть меньше 1!'})
 
     class Meta:
         model = IngredientsInRecipe
@@ -91,11 +135,10 @@ class AddIngredientInRecipeSerializer(ModelSerializer):
 
 class CreateRecipeSerializer(ModelSerializer):
     '''Сериализатор для создания рецептов.'''
-    tags = PrimaryKeyRelatedField(queryset=Tag.objects.all(),
-                                  many=True)
+    tags = ListField(child=IntegerField())
     author = CustomUserSerializer(read_only=True)
     ingredients = AddIngredientInRecipeSerializer(many=True)
-    image = Base64ImageField(max_length=None,
+    image = RecipeImageField(max_length=None,
                              use_url=True)
 
     class Meta:
@@ -107,34 +150,34 @@ class CreateRecipeSerializer(ModelSerializer):
                   'name',
                   'image',
                   'text',
-                  'cooking_time')
+                  'cooking_time',
+                  'servings')
 
     def validate_ingredients(self, value):
         if not value:
             raise ValidationError(
                 'Должен присутствовать хотя бы один ингредиент!')
-        ingredients_list = []
-        for i in value:
-            if i['id'] in ingredients_list:
-                raise ValidationError(
-                    'Ингредиенты должны быть уникальными!')
-            ingredients_list.append(i['id'])
-            if int(i['amount']) <= 0:
-                raise ValidationError(
-                    'Количество не может быть меньше 1!')
-            return value
-
-    def validate_tags(self, data):
-        tags_list = []
-        for tag in data:
-            if not tag:
-                raise ValidationError(
-                    'Нужен хотя бы один тэг для рецепта!')
-            if tag in tags_list:
-                raise ValidationError(
-                    'Теги должны быть уникальными!')
-            tags_list.append(tag)
-        return data
+        ids = [item['id'] for item in value]
+        if len(set(ids)) != len(ids):
+            raise ValidationError('Ингредиенты должны быть уникальными!')
+        found = Ingredient.objects.in_bulk(ids)
+        errors = [{} if pk in found
+                  else {'id': [f'Ингредиента с id={pk} не существует.']}
+                  for pk in ids]
+        if any(errors):
+            raise ValidationError(errors)
+        return value
+
+    def validate_tags(self, value):
+        if not value:
+            raise ValidationError('Нужен хотя бы один тэг для рецепта!')
+        if len(set(value)) != len(value):
+            raise ValidationError('Теги должны быть уникальными!')
+        missing = set(value) - Tag.objects.in_bulk(value).keys()
+        if missing:
+            raise ValidationError(
+                f'Тегов с id {sorted(missing)} не существует.')
+        return value
 
     def create_ingredients(self, ingredients, recipe):
         recipe_ingredients = []
@@ -143,7 +186,8 @@ class CreateRecipeSerializer(ModelSerializer):
                 IngredientsInRecipe(recipe=recipe,
                                     ingredient_id=ingredient.get('id'),
                                     amount=ingredient.get('amount')))
-        IngredientsInRecipe.objects.bulk_create(recipe_ingredients)
+        if recipe_ingredients:
+            IngredientsInRecipe.objects.bulk_create(recipe_ingredients)
 
     @transaction.atomic
     def create(self, validated_data):
@@ -152,22 +196,60 @@ class CreateRecipeSerializer(ModelSerializer):
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.create_ingredients(ingredients, recipe)
+        schedule_variants(recipe.image)
         return recipe
 
+    def update_tags(self, recipe, tags):
+        current = set(recipe.tags.values_list('id', flat=True))
+        new = set(tags)
+        if current - new:
+            recipe.tags.remove(*(current - new))
+        if new - current:
+            recipe.tags.add(*(new - current))
+
+    def update_ingredients(self, recipe, ingredients):
+        '''Изменить состав рецепта массовыми запросами.
+
+        Они не отправляют сигналов строк, поэтому списки покупок
+        поправляются здесь одним вызовом на все изменения.
+        '''
+        current = {item.ingredient_id: item
+                   for item in IngredientsInRecipe.objects.filter(
+                       recipe=recipe)}
+        new = {item['id']: item['amount'] for item in ingredients}
+        removed = current.keys() - new.keys()
+        changes = [(ingredient_id, -current[ingredient_id].amount)
+                   for ingredient_id in removed]
+        if removed:
+            rows = IngredientsInRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed)
+            rows._raw_delete(rows.db)
+        changed = []
+        for ingredient_id, item in current.items():
+            amount = new.get(ingredient_id)
+            if amount is not None and amount != item.amount:
+                changes.append((ingredient_id, amount - item.amount))
+                item.amount = amount
+                changed.append(item)
+        if changed:
+            IngredientsInRecipe.objects.bulk_update(changed, ('amount',))
+        added = [item for item in ingredients if item['id'] not in current]
+        self.create_ingredients(added, recipe)
+        changes += [(item['id'], item['amount']) for item in added]
+        if changes:
+            recipe_items_changed(recipe.pk, changes)
+
     @transaction.atomic
     def update(self, instance, validated_data):
-        instance.image = validated_data.get('image', instance.image)
-        tags = validated_data.pop('tags')
-        instance.tags.clear()
-        IngredientsInRecipe.objects.filter(recipe=instance).all().delete()
-        instance.tags.set(tags)
-        instance.name = validated_data.get('name', instance.name)
-        instance.text = validated_data.get('text', instance.text)
-        instance.cooking_time = validated_data.get('cooking_time',
-                                                   instance.cooking_time)
-        self.create_ingredients(ingredients=validated_data.get('ingredients'),
-                                recipe=instance)
-        instance.save()
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        if tags is not None:
+            self.update_tags(instance, tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        instance = super().update(instance, validated_data)
+        if 'image' in validated_data:
+            schedule_variants(instance.image)
         return instance
 
     def to_representation(self, instance):
@@ -175,24 +257,30 @@ class CreateRecipeSerializer(ModelSerializer):
             'request': self.context.get('request')}).data
 
 
-class ShortRecipeSerializer(ModelSerializer):
+class ShortRecipeSerializer(FastRepresentationMixin, ModelSerializer):
     '''Сериализатор короткой версии рецептов.'''
+    image_variants = SerializerMethodField()
+
     class Meta:
         model = Recipe
         fields = ('id',
                   'name',
                   'image',
+                  'image_variants',
                   'cooking_time')
         read_only_fields = ('id',
                             'name',
                             'image',
                             'cooking_time')
 
+    def get_image_variants(self, obj):
+        return variant_urls(obj, self.context.get('request'))
+
 
 class FollowSerializer(CustomUserSerializer):
     '''Сериализатор для подписок.'''
     recipes = SerializerMethodField()
-    recipes_count = SerializerMethodField()
+    recipes_count = ReadOnlyField()
 
     class Meta(CustomUserSerializer.Meta):
         fields = ('email',
@@ -219,18 +307,19 @@ class FollowSerializer(CustomUserSerializer):
                 'Нельзя подписываться на себя')
         return data
 
-    def get_recipes_count(self, obj):
-        amount = (obj.recipes.aggregate(count=Count('id')))
-        return amount['count']
-
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
-        serializer = ShortRecipeSerializer(recipes, many=True, read_only=True)
-        return serializer.data
+        '''Рецепты автора: предзагруженные в limited_recipes или первые
+        recipes_limit из контекста, уже проверенного
+        RecipesLimitSerializer.'''
+        if hasattr(obj, 'limited_recipes'):
+            recipes = obj.limited_recipes
+        else:
+            recipes = obj.recipes.all()
+            limit = self.context.get('recipes_limit')
+            if limit is not None:
+                recipes = recipes[:limit]
+        return ShortRecipeSerializer(recipes, many=True, read_only=True,
+                                     context=self.context).data
 
 
 class FavouriteSerializer(ModelSerializer):
@@ -273,3 +362,12 @@ class ShoppingCartSerializer(ModelSerializer):
         if recipe.shopping_cart.filter(user=user).exists():
             raise ValidationError('Рецепт уже добавлен в корзину.')
         return obj
+
+
+class BulkRecipesSerializer(Serializer):
+    '''Список id рецептов для пакетного добавления и удаления.'''
+    recipes = ListField(child=IntegerField(min_value=1), allow_empty=False,
+                        max_length=MAX_BULK_RECIPES)
+
+    def validate_recipes(self, value):
+        return list(dict.fromkeys(value))
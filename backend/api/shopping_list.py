@@ -0,0 +1,148 @@
+from itertools import islice
+
+from django.db.models import Case, F, FloatField, Sum, Value, When
+from django.db.models.functions import Cast, Coalesce
+
+from .models import ShoppingCart, ShoppingListItem
+from .units import base_unit, humanize, unit_factor
+
+EPSILON = 1e-6
+# Количество ингредиента в позиции корзины с учетом порций: количество
+# в рецепте, умноженное на число порций в корзине и деленное на число
+# порций рецепта.
+SCALED_AMOUNT = (
+    Cast('recipe__recipe__amount', FloatField())
+    * Coalesce('servings', 'recipe__servings') / F('recipe__servings'))
+
+
+def cart_amounts(carts, sign=1):
+    '''Вклад позиций корзин carts в списки покупок одним запросом:
+    {(id пользователя, id ингредиента): количество}.'''
+    rows = carts.order_by().values(
+        'user_id', 'recipe__recipe__ingredient_id').annotate(
+        total=Sum(SCALED_AMOUNT)).values_list(
+        'user_id', 'recipe__recipe__ingredient_id', 'total')
+    return {(user_id, ingredient_id): sign * total
+            for user_id, ingredient_id, total in rows
+            if ingredient_id is not None}
+
+
+def apply_deltas(deltas):
+    '''Прибавить deltas {(id пользователя, id ингредиента): количество}
+    к спискам покупок.
+
+    Существующие строки меняются одним UPDATE, недостающие добавляются
+    одной вставкой, обнулившиеся удаляются.
+    '''
+    deltas = {key: delta for key, delta in deltas.items()
+              if abs(delta) > EPSILON}
+    if not deltas:
+        return
+    items = ShoppingListItem.objects.filter(
+        user_id__in={user_id for user_id, _ in deltas},
+        ingredient_id__in={ingredient_id for _, ingredient_id in deltas})
+    existing = set(items.values_list('user_id', 'ingredient_id'))
+    if existing:
+        items.update(amount=F('amount') + Case(
+            *(When(user_id=user_id, ingredient_id=ingredient_id,
+                   then=Value(delta))
+              for (user_id, ingredient_id), delta in deltas.items()
+              if (user_id, ingredient_id) in existing),
+            default=Value(0.0), output_field=FloatField()))
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                         amount=delta)
+        for (user_id, ingredient_id), delta in deltas.items()
+        if delta > 0 and (user_id, ingredient_id) not in existing)
+    if any(delta < 0 for delta in deltas.values()):
+        items.filter(amount__lte=EPSILON).delete()
+
+
+def add_recipes(user_id, recipe_ids):
+    '''Учесть рецепты, уже добавленные в корзину пользователя.'''
+    if recipe_ids:
+        apply_deltas(cart_amounts(ShoppingCart.objects.filter(
+            user_id=user_id, recipe_id__in=recipe_ids)))
+
+
+def remove_recipes(user_id, recipe_ids):
+    '''Учесть рецепты, которые сейчас будут убраны из корзины.'''
+    if recipe_ids:
+        apply_deltas(cart_amounts(ShoppingCart.objects.filter(
+            user_id=user_id, recipe_id__in=recipe_ids), sign=-1))
+
+
+def amounts_changed(before, carts):
+    '''Учесть изменение позиций корзин carts: порций рецепта или порций
+    в корзине. before - их вклад до изменения, cart_amounts(carts, -1).'''
+    deltas = dict(before)
+    for key, amount in cart_amounts(carts).items():
+        deltas[key] = deltas.get(key, 0) + amount
+    apply_deltas(deltas)
+
+
+def recipe_items_changed(recipe_id, changes):
+    '''Учесть изменение состава рецепта: changes - пары (id ингредиента,
+    изменение количества в рецепте).
+
+    Возвращает id пользователей, у которых рецепт в корзине.
+    '''
+    scales = {
+        user_id: (servings or recipe_servings) / recipe_servings
+        for user_id, servings, recipe_servings in ShoppingCart.objects
+        .filter(recipe_id=recipe_id)
+        .values_list('user_id', 'servings', 'recipe__servings')}
+    deltas = {}
+    for ingredient_id, amount in changes:
+        for user_id, scale in scales.items():
+            key = (user_id, ingredient_id)
+            deltas[key] = deltas.get(key, 0) + amount * scale
+    apply_deltas(deltas)
+    return scales.keys()
+
+
+def recipe_deleted(recipe):
+    '''Убрать удаляемый рецепт из списков покупок.'''
+    apply_deltas(cart_amounts(ShoppingCart.objects.filter(recipe=recipe),
+                              sign=-1))
+
+
+def get_rows(user):
+    '''Список покупок пользователя: одноименные ингредиенты в разных
+    единицах (г и кг, мл и л) сводятся одним запросом, количества
+    округляются с учетом единиц.'''
+    rows = user.shopping_list.values(
+        name=F('ingredient__name'),
+        unit=base_unit('ingredient__measurement_unit'),
+    ).annotate(
+        total=Sum(F('amount') * unit_factor('ingredient__measurement_unit'))
+    ).order_by('name', 'unit')
+    for row in rows.iterator():
+        amount, unit = humanize(row['total'], row['unit'])
+        yield {'name': row['name'], 'measurement_unit': unit,
+               'amount': amount}
+
+
+def rebuild(user_ids=None, batch_size=1000):
+    '''Пересобрать списки покупок по корзинам. Возвращает число строк.'''
+    items = ShoppingListItem.objects.all()
+    carts = ShoppingCart.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+        carts = carts.filter(user_id__in=user_ids)
+    items.delete()
+    rows = carts.order_by().values(
+        'user_id', 'recipe__recipe__ingredient_id').annotate(
+        total=Sum(SCALED_AMOUNT)).filter(total__gt=EPSILON)
+    new_items = (
+        ShoppingListItem(user_id=row['user_id'],
+                         ingredient_id=row['recipe__recipe__ingredient_id'],
+                         amount=row['total'])
+        for row in rows.iterator())
+    total = 0
+    while True:
+        batch = list(islice(new_items, batch_size))
+        if not batch:
+            return total
+        ShoppingListItem.objects.bulk_create(batch)
+        total += len(batch)
@@ -0,0 +1,236 @@
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from users.models import Follow
+
+from .cache import (INGREDIENTS_VERSION, RECIPE_CHANGES, RECIPES_VERSION,
+                    TAGS_VERSION, bump_version, bump_versions,
+                    recipe_version_key, record_changes)
+from .exports import invalidate_shopping_cart
+from .models import (Favourite, Ingredient, IngredientsInRecipe, Recipe,
+                     ShoppingCart, Tag, User)
+from .relations import relations_changed
+from .search import update_search_vectors
+from .shopping_list import (add_recipes, amounts_changed, cart_amounts,
+                            recipe_deleted, recipe_items_changed,
+                            remove_recipes)
+
+
+def invalidate_carts(user_ids):
+    for user_id in set(user_ids):
+        transaction.on_commit(
+            lambda user_id=user_id: invalidate_shopping_cart(user_id))
+
+
+AUTHOR_FIELDS = frozenset({'username', 'email', 'first_name', 'last_name'})
+RELATION_COUNTERS = {
+    Favourite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+def change_counters(model, pks, field, delta):
+    '''Изменить счетчик через F(); уменьшение не опускает его ниже нуля.
+
+    Строки, созданные до появления счетчиков и еще не пересчитанные
+    reconcile_counters, не должны ломать удаление.
+    '''
+    value = F(field) + delta
+    if delta < 0:
+        value = Greatest(value, 0)
+    model.objects.filter(pk__in=pks).update(**{field: value})
+
+
+def deleted_directly(sender, origin):
+    '''Удаляется сама строка sender, а не каскадом.
+
+    При удалении рецепта списки покупок поправляет recipe_deleting, а
+    список удаляемого пользователя или ингредиента удаляется вместе с ним.
+    '''
+    return (isinstance(origin, sender)
+            or getattr(origin, 'model', None) is sender)
+
+
+def saved_values(instance, *fields):
+    '''Значения полей instance в базе; None для еще не сохраненной строки.'''
+    if instance._state.adding:
+        return None
+    return type(instance).objects.filter(pk=instance.pk).values_list(
+        *fields).first()
+
+
+def recipe_responses_changed(recipe_ids):
+    '''Сбросить кэш ответов с рецептами, не трогая поиск и индексы.'''
+    recipe_ids = set(recipe_ids)
+    transaction.on_commit(lambda: bump_versions(
+        [RECIPES_VERSION, *map(recipe_version_key, recipe_ids)]))
+
+
+def recipes_changed(recipe_ids):
+    '''Обновить поиск и индексы рецептов и сбросить кэш ответов.'''
+    recipe_ids = set(recipe_ids)
+
+    def refresh():
+        update_search_vectors(recipe_ids)
+        record_changes(RECIPE_CHANGES, recipe_ids)
+    transaction.on_commit(refresh)
+    recipe_responses_changed(recipe_ids)
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def shopping_cart_changed(sender, instance, **kwargs):
+    invalidate_carts([instance.user_id])
+
+
+@receiver(pre_save, sender=ShoppingCart)
+def shopping_cart_saving(sender, instance, **kwargs):
+    saved = saved_values(instance, 'user_id', 'recipe_id', 'servings')
+    if saved is not None and saved != (
+            instance.user_id, instance.recipe_id, instance.servings):
+        instance._list_amounts = cart_amounts(
+            ShoppingCart.objects.filter(pk=instance.pk), sign=-1)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def shopping_cart_saved(sender, instance, created, **kwargs):
+    before = vars(instance).pop('_list_amounts', None)
+    if created:
+        add_recipes(instance.user_id, [instance.recipe_id])
+    elif before is not None:
+        amounts_changed(before, ShoppingCart.objects.filter(pk=instance.pk))
+        invalidate_carts(user_id for user_id, _ in before)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def shopping_cart_deleting(sender, instance, origin=None, **kwargs):
+    if deleted_directly(sender, origin):
+        remove_recipes(instance.user_id, [instance.recipe_id])
+
+
+@receiver(post_save, sender=Favourite)
+@receiver(post_save, sender=ShoppingCart)
+def relation_added(sender, instance, created, **kwargs):
+    if created:
+        change_counters(Recipe, [instance.recipe_id],
+                        RELATION_COUNTERS[sender], 1)
+
+
+@receiver(post_delete, sender=Favourite)
+@receiver(post_delete, sender=ShoppingCart)
+def relation_removed(sender, instance, **kwargs):
+    change_counters(Recipe, [instance.recipe_id],
+                    RELATION_COUNTERS[sender], -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_added(sender, instance, created, **kwargs):
+    if created:
+        change_counters(User, [instance.author_id], 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_removed(sender, instance, **kwargs):
+    change_counters(User, [instance.author_id], 'recipes_count', -1)
+
+
+@receiver((post_save, post_delete), sender=Favourite)
+@receiver((post_save, post_delete), sender=ShoppingCart)
+@receiver((post_save, post_delete), sender=Follow)
+def user_relation_changed(sender, instance, **kwargs):
+    relations_changed([instance.user_id])
+
+
+@receiver(pre_save, sender=Recipe)
+def recipe_saving(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'servings' not in update_fields:
+        return
+    saved = saved_values(instance, 'servings')
+    if saved is not None and saved[0] != instance.servings:
+        instance._list_amounts = cart_amounts(
+            ShoppingCart.objects.filter(recipe=instance), sign=-1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_changed(sender, instance, created, **kwargs):
+    if not created:
+        carts = ShoppingCart.objects.filter(recipe=instance)
+        before = vars(instance).pop('_list_amounts', None)
+        if before is not None:
+            amounts_changed(before, carts)
+        invalidate_carts(carts.values_list('user_id', flat=True))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def recipe_search_changed(sender, instance, **kwargs):
+    recipes_changed([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=IngredientsInRecipe)
+def recipe_ingredients_changed(sender, instance, **kwargs):
+    recipes_changed([instance.recipe_id])
+
+
+@receiver(pre_save, sender=IngredientsInRecipe)
+def recipe_ingredient_saving(sender, instance, **kwargs):
+    instance._saved_item = saved_values(
+        instance, 'recipe_id', 'ingredient_id', 'amount')
+
+
+@receiver(post_save, sender=IngredientsInRecipe)
+def recipe_ingredient_saved(sender, instance, **kwargs):
+    saved = vars(instance).pop('_saved_item', None)
+    item = (instance.recipe_id, instance.ingredient_id, instance.amount)
+    if saved == item:
+        return
+    changes = defaultdict(list)
+    changes[instance.recipe_id].append(
+        (instance.ingredient_id, instance.amount))
+    if saved is not None:
+        recipe_id, ingredient_id, amount = saved
+        changes[recipe_id].append((ingredient_id, -amount))
+    for recipe_id, items in changes.items():
+        invalidate_carts(recipe_items_changed(recipe_id, items))
+
+
+@receiver(pre_delete, sender=IngredientsInRecipe)
+def recipe_ingredient_deleting(sender, instance, origin=None, **kwargs):
+    if deleted_directly(sender, origin):
+        invalidate_carts(recipe_items_changed(
+            instance.recipe_id, [(instance.ingredient_id, -instance.amount)]))
+
+
+@receiver(post_save, sender=User)
+def author_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None
+                   and AUTHOR_FIELDS.isdisjoint(update_fields)):
+        return
+    recipe_responses_changed(instance.recipes.values_list('id', flat=True))
+
+
+@receiver(pre_delete, sender=Recipe)
+def recipe_deleting(sender, instance, **kwargs):
+    recipe_deleted(instance)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, created, **kwargs):
+    if not created:
+        invalidate_carts(ShoppingCart.objects.filter(
+            recipe__ingredients=instance).values_list('user_id', flat=True))
+        recipes_changed(instance.recipes.values_list('id', flat=True))
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(INGREDIENTS_VERSION))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def tags_changed(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version(TAGS_VERSION))
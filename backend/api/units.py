@@ -0,0 +1,56 @@
+import math
+
+from django.db.models import Case, F, FloatField, Value, When
+
+# Единица -> (базовая единица, множитель перевода в неё).
+UNIT_CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+}
+# Базовая единица -> (крупная единица, с какого количества переходить).
+LARGER_UNITS = {
+    'г': ('кг', 1000),
+    'мл': ('л', 1000),
+}
+PRECISE_UNITS = {'г', 'мл'}
+COUNTABLE_UNITS = {
+    'шт.', 'банка', 'батон', 'бутылка', 'зубчик', 'кусок', 'лист',
+    'пакет', 'пакетик', 'пачка', 'пласт', 'пучок', 'стебель', 'стручок',
+    'тушка', 'упаковка',
+}
+
+
+def base_unit(unit_field):
+    '''Выражение базовой единицы измерения для поля unit_field.'''
+    return Case(
+        *(When(**{unit_field: unit}, then=Value(base))
+          for unit, (base, _) in UNIT_CONVERSIONS.items()),
+        default=F(unit_field))
+
+
+def unit_factor(unit_field):
+    '''Выражение множителя перевода количества в базовую единицу.'''
+    return Case(
+        *(When(**{unit_field: unit}, then=Value(float(factor)))
+          for unit, (_, factor) in UNIT_CONVERSIONS.items()),
+        default=Value(1.0), output_field=FloatField())
+
+
+def humanize(amount, unit):
+    '''Округлить количество с учетом единицы измерения.
+
+    Граммы и миллилитры от тысячи переводятся в килограммы и литры,
+    штучные единицы округляются вверх, остальное до десятых.
+    '''
+    if unit in LARGER_UNITS and amount >= LARGER_UNITS[unit][1]:
+        larger, factor = LARGER_UNITS[unit]
+        return compact(round(amount / factor, 2)), larger
+    if unit in COUNTABLE_UNITS:
+        return math.ceil(round(amount, 6)), unit
+    if unit in PRECISE_UNITS:
+        return max(round(amount), 1), unit
+    return compact(round(amount, 1)), unit
+
+
+def compact(amount):
+    return int(amount) if float(amount).is_integer() else amount
@@ -1,51 +1,73 @@
-import io
-
-from django.db.models.aggregates import Sum
-from django.http import FileResponse
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
 from rest_framework import status
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.filters import OrderingFilter
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
+from users.models import Follow
+
+from .cache import (INGREDIENTS_VERSION, TAGS_VERSION, AnonymousCacheMixin,
+                    CachedReadOnlyMixin)
+from .exports import ShoppingCartExport
 from .filters import IngredientFilter, RecipeFilter
-from .models import Favourite, Ingredient, Recipe, ShoppingCart, Tag
-from .pagination import LimitPageNumberPagination
+from .indexes import recipe_ingredient_index
+from .models import Favourite, Ingredient, Recipe, ShoppingCart, Tag, User
+from .pagination import (FeedPagination, KeysetPagination,
+                         LimitPageNumberPagination)
 from .permissions import IsAdminOrReadOnly, IsAuthorOrReadOnly
-from .serializers import (CreateRecipeSerializer, FavouriteSerializer,
-                          IngredientSerializer, ReadRecipeSerializer,
-                          ShoppingCartSerializer, TagSerializer)
+from .relations import relations_changed
+from .renderers import CSVRenderer, PDFRenderer, TXTRenderer
+from .serializers import (BulkRecipesSerializer, CartServingsSerializer,
+                          CreateRecipeSerializer, FavouriteSerializer,
+                          IngredientSerializer, MatchedRecipeSerializer,
+                          OwnedIngredientsSerializer, ReadRecipeSerializer,
+                          ShoppingCartSerializer, ShoppingListItemSerializer,
+                          TagSerializer)
+from .shopping_list import add_recipes, get_rows, remove_recipes
+from .signals import RELATION_COUNTERS, change_counters, invalidate_carts
+
+
+MAX_FEED_AUTHORS = 500
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(CachedReadOnlyMixin, ReadOnlyModelViewSet):
     '''Вьюсет для тегов.'''
+    cache_version_key = TAGS_VERSION
     permission_classes = (IsAdminOrReadOnly,)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class IngredientsViewSet(ReadOnlyModelViewSet):
+class IngredientsViewSet(CachedReadOnlyMixin, ReadOnlyModelViewSet):
     '''Вьюсет для ингредиентов.'''
+    cache_version_key = INGREDIENTS_VERSION
     permission_classes = (IsAdminOrReadOnly,)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = (IngredientFilter,)
-    search_fields = ('^name',)
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(AnonymousCacheMixin, ModelViewSet):
     '''Вьюсет для рецептов/избранное/корзина/скачивание корзины.'''
     permission_classes = [IsAuthorOrReadOnly | IsAdminOrReadOnly]
     queryset = Recipe.objects.all()
-    pagination_class = LimitPageNumberPagination
-    filter_backends = (DjangoFilterBackend,)
+    pagination_class = FeedPagination
+    filter_backends = (DjangoFilterBackend, OrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ('id', 'favorites_count', 'in_carts_count')
 
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            return Recipe.objects.for_read()
+        return super().get_queryset()
+
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -61,16 +83,19 @@ class RecipeViewSet(ModelViewSet):
         recipe = get_object_or_404(Recipe, **kwargs)
         serializer = FavouriteSerializer(recipe, data=request.data,
                                          context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        Favourite.objects.create(user=user, recipe=recipe)
+        with transaction.atomic():
+            self.lock_user(user)
+            serializer.is_valid(raise_exception=True)
+            Favourite.objects.create(user=user, recipe=recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @favorite.mapping.delete
     def del_favorite(self, request, **kwargs):
         user = self.request.user
         recipe = get_object_or_404(Recipe, **kwargs)
-        get_object_or_404(Favourite, user=user,
-                          recipe=recipe).delete()
+        with transaction.atomic():
+            self.lock_user(user)
+            get_object_or_404(Favourite, user=user, recipe=recipe).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['post'],
@@ -80,47 +105,211 @@ class RecipeViewSet(ModelViewSet):
         recipe = get_object_or_404(Recipe, **kwargs)
         serializer = ShoppingCartSerializer(recipe, data=request.data,
                                             context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        ShoppingCart.objects.create(user=user, recipe=recipe)
+        servings = CartServingsSerializer(data=request.data)
+        servings.is_valid(raise_exception=True)
+        with transaction.atomic():
+            self.lock_user(user)
+            serializer.is_valid(raise_exception=True)
+            ShoppingCart.objects.create(
+                user=user, recipe=recipe,
+                servings=servings.validated_data.get('servings'))
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @shopping_cart.mapping.patch
+    def update_shopping_cart(self, request, **kwargs):
+        serializer = CartServingsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        carts = ShoppingCart.objects.filter(user=request.user, **{
+            f'recipe__{name}': value for name, value in kwargs.items()})
+        with transaction.atomic():
+            cart = get_object_or_404(carts)
+            cart.servings = serializer.validated_data.get('servings')
+            cart.save(update_fields=('servings',))
+        return Response({'id': cart.recipe_id, 'servings': cart.servings})
+
     @shopping_cart.mapping.delete
     def del_shopping_cart(self, request, **kwargs):
         user = self.request.user
         recipe = get_object_or_404(Recipe, **kwargs)
-        get_object_or_404(ShoppingCart, user=user,
-                          recipe=recipe).delete()
+        with transaction.atomic():
+            self.lock_user(user)
+            get_object_or_404(ShoppingCart, user=user,
+                              recipe=recipe).delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
+    def get_bulk_ids(self, request):
+        serializer = BulkRecipesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['recipes']
+
+    def lock_user(self, user):
+        '''Заблокировать строку пользователя до конца транзакции.
+
+        Все добавления и удаления одного пользователя в избранном и
+        корзине, одиночные и массовые, идут по очереди: набор уже
+        добавленных рецептов не меняется между проверкой и записью, и
+        вставка не падает на уникальности.
+        '''
+        User.objects.select_for_update().filter(pk=user.pk).values_list(
+            'pk', flat=True).first()
+
+    def bulk_add(self, request, model):
+        '''Добавить рецепты в избранное или корзину одной вставкой.
+
+        bulk_create не отправляет post_save, поэтому счетчики
+        увеличиваются здесь и только для вставленных строк: рецептов,
+        которых не было среди уже добавленных пользователем.
+        '''
+        counter = RELATION_COUNTERS[model]
+        ids = self.get_bulk_ids(request)
+        user = request.user
+        with transaction.atomic():
+            self.lock_user(user)
+            found = set(Recipe.objects.filter(pk__in=ids).values_list(
+                'pk', flat=True))
+            existing = set(model.objects.filter(
+                user=user, recipe_id__in=found).values_list(
+                'recipe_id', flat=True))
+            new = [pk for pk in ids if pk in found and pk not in existing]
+            if new:
+                model.objects.bulk_create(
+                    model(user=user, recipe_id=pk) for pk in new)
+                change_counters(Recipe, new, counter, 1)
+                relations_changed([user.pk])
+                if model is ShoppingCart:
+                    add_recipes(user.pk, new)
+                    invalidate_carts([user.pk])
+        results = [
+            {'id': pk,
+             'status': ('not_found' if pk not in found
+                        else 'exists' if pk in existing else 'added')}
+            for pk in ids]
+        return Response({'results': results},
+                        status=(status.HTTP_201_CREATED if new
+                                else status.HTTP_200_OK))
+
+    def bulk_remove(self, request, model):
+        '''Убрать рецепты из избранного или корзины одним удалением.
+
+        Удаление идет без post_delete на каждую строку (у связей нет
+        зависимых таблиц), поэтому счетчики и кэши обновляются здесь
+        одним запросом, как в bulk_add.
+        '''
+        counter = RELATION_COUNTERS[model]
+        ids = self.get_bulk_ids(request)
+        relations = model.objects.filter(user=request.user,
+                                         recipe_id__in=ids)
+        with transaction.atomic():
+            self.lock_user(request.user)
+            removed = set(relations.values_list('recipe_id', flat=True))
+            if removed:
+                if model is ShoppingCart:
+                    remove_recipes(request.user.pk, removed)
+                    invalidate_carts([request.user.pk])
+                relations = relations.filter(recipe_id__in=removed)
+                relations._raw_delete(relations.db)
+                change_counters(Recipe, removed, counter, -1)
+                relations_changed([request.user.pk])
+        results = [
+            {'id': pk, 'status': 'removed' if pk in removed else 'not_found'}
+            for pk in ids]
+        return Response({'results': results})
+
+    @action(detail=False, methods=['post'], url_path='favorite',
+            url_name='favorite-bulk', permission_classes=(IsAuthenticated,))
+    def favorite_bulk(self, request):
+        return self.bulk_add(request, Favourite)
+
+    @favorite_bulk.mapping.delete
+    def del_favorite_bulk(self, request):
+        return self.bulk_remove(request, Favourite)
+
+    @action(detail=False, methods=['post'], url_path='shopping_cart',
+            url_name='shopping-cart-bulk',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_bulk(self, request):
+        return self.bulk_add(request, ShoppingCart)
+
+    @shopping_cart_bulk.mapping.delete
+    def del_shopping_cart_bulk(self, request):
+        return self.bulk_remove(request, ShoppingCart)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,),
+            pagination_class=KeysetPagination)
+    def feed(self, request):
+        '''Рецепты авторов, на которых подписан пользователь.
+
+        Учитываются MAX_FEED_AUTHORS последних подписок.
+        '''
+        authors = Follow.objects.filter(user=request.user).order_by(
+            '-id').values('author_id')[:MAX_FEED_AUTHORS]
+        queryset = self.filter_queryset(self.get_queryset()).filter(
+            author_id__in=authors).order_by('-id')
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'])
+    def popular(self, request):
+        '''Популярные рецепты по рейтингу из compute_popularity.'''
+        queryset = self.filter_queryset(self.get_queryset()).annotate(
+            popularity_score=F('popularity__score')).filter(
+            popularity_score__isnull=False).order_by(
+            '-popularity_score', '-id')
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=['get'], url_path='by_ingredients',
+            pagination_class=LimitPageNumberPagination)
+    def by_ingredients(self, request):
+        '''Рецепты по доле имеющихся ингредиентов ?ingredients=1,2,3.'''
+        owned = [value
+                 for raw in request.query_params.getlist('ingredients')
+                 for value in raw.split(',') if value]
+        serializer = OwnedIngredientsSerializer(data={'ingredients': owned})
+        serializer.is_valid(raise_exception=True)
+        page = self.paginate_queryset(recipe_ingredient_index.match(
+            serializer.validated_data['ingredients']))
+        recipes = self.get_queryset().in_bulk([pk for pk, _, _ in page])
+        matched = []
+        for pk, coverage, missing in page:
+            recipe = recipes.get(pk)
+            if recipe is not None:
+                recipe.coverage = round(coverage, 3)
+                recipe.missing = missing
+                matched.append(recipe)
+        serializer = MatchedRecipeSerializer(
+            matched, many=True, context=self.get_serializer_context())
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=False, methods=['get'],
             permission_classes=(IsAuthenticated,))
+    def shopping_list(self, request):
+        serializer = ShoppingListItemSerializer(
+            get_rows(request.user), many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=(PDFRenderer, TXTRenderer, CSVRenderer))
     def download_shopping_cart(self, request):
-        buffer = io.BytesIO()
-        page = canvas.Canvas(buffer)
-        pdfmetrics.registerFont(TTFont('arial', 'fronts/arial.ttf'))
-        user = request.user
-        if not user.shopping_cart.exists():
-            return Response('Корзина пуста',
-                            status=status.HTTP_400_BAD_REQUEST)
-        ingredient_name = 'recipe__recipe__ingredient__name'
-        ingredient_unit = 'recipe__recipe__ingredient__measurement_unit'
-        recipe_amount = 'recipe__recipe__amount'
-        amount_sum = 'recipe__recipe__amount__sum'
-        shopping_cart = user.shopping_cart.select_related('recipe').values(
-            ingredient_name, ingredient_unit
-        ).annotate(Sum(recipe_amount)).order_by(ingredient_name)
-        page.setFont('arial', 14)
-        x_position, y_position = 50, 800
-        if shopping_cart:
-            page.drawString(x_position, y_position, 'Cписок покупок:')
-            for num, recipe in enumerate(shopping_cart, start=1):
-                page.drawString(
-                    x_position, y_position - 20,
-                    f'{num}. {recipe[ingredient_name]}: '
-                    f'{recipe[amount_sum]} '
-                    f'{recipe[ingredient_unit]}.')
-                y_position -= 15
-        page.save()
-        buffer.seek(0)
-        return FileResponse(buffer, as_attachment=True,
-                            filename='shopping_cart.pdf')
+        export = ShoppingCartExport(request.user,
+                                    request.accepted_renderer.format)
+        content = export.get_cached()
+        if content is None:
+            if not request.user.shopping_list.exists():
+                return Response('Корзина пуста',
+                                status=status.HTTP_400_BAD_REQUEST)
+            if export.format != 'pdf':
+                response = StreamingHttpResponse(
+                    export.stream(), content_type=export.content_type)
+                response['Content-Disposition'] = (
+                    f'attachment; filename="{export.filename}"')
+                return response
+            content = export.render()
+        response = HttpResponse(content, content_type=export.content_type)
+        response['Content-Disposition'] = (
+            f'attachment; filename="{export.filename}"')
+        return response
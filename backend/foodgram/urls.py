@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
 
+API_URLS = 'api.async_urls' if settings.ASYNC_READ_VIEWS else 'api.urls'
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('users.urls', namespace='api_users')),
-    path('api/', include('api.urls', namespace='api'))
+    path('api/', include(API_URLS, namespace='api'))
 ]
@@ -5,9 +5,11 @@ from .models import Follow, User
 
 @admin.register(User)
 class UserAdmin(admin.ModelAdmin):
-    list_display = ['username', 'email', 'first_name', 'last_name']
+    list_display = ['username', 'email', 'first_name', 'last_name',
+                    'recipes_count']
     list_filter = ('email', 'username')
     search_fields = ('email', 'username')
+    readonly_fields = ('recipes_count',)
 
 
 @admin.register(Follow)
@@ -3,7 +3,29 @@ from django.db import models
 from django.db.models import UniqueConstraint
 
 
-class User(AbstractUser):
+class CountersMixin:
+    '''Модель со счетчиками, которые меняются только через F().
+
+    Обычное сохранение уже загруженного объекта не записывает поля из
+    counter_fields, чтобы не затереть прибавления других запросов
+    устаревшими значениями из памяти. Туда же относятся другие поля,
+    которые пишутся только запросами update().
+    '''
+    counter_fields = ()
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if (update_fields is None and not self._state.adding
+                and not kwargs.get('force_insert')):
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.attname for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.attname not in deferred
+                and field.name not in self.counter_fields]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+
+class User(CountersMixin, AbstractUser):
     '''Модель пользователя.'''
     email = models.EmailField('Email',
                               max_length=200,
@@ -12,6 +34,10 @@ class User(AbstractUser):
                                   max_length=150)
     last_name = models.CharField('Фамилия',
                                  max_length=150)
+    recipes_count = models.PositiveIntegerField('Количество рецептов',
+                                                default=0)
+
+    counter_fields = ('recipes_count',)
 
     class Meta:
         ordering = ['id']
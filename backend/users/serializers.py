@@ -1,7 +1,10 @@
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from rest_framework import serializers
 
-from .models import Follow, User
+from api.relations import user_relations
+from api.representation import FastRepresentationMixin
+
+from .models import User
 
 
 class CreateUserSerializer(UserCreateSerializer):
@@ -27,7 +30,7 @@ class CreateUserSerializer(UserCreateSerializer):
         }
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(FastRepresentationMixin, UserSerializer):
     '''Сериализатор показа пользователей'''
     is_subscribed = serializers.SerializerMethodField(read_only=True)
 
@@ -41,7 +44,5 @@ class CustomUserSerializer(UserSerializer):
                   'is_subscribed',)
 
     def get_is_subscribed(self, obj):
-        user_id = obj.id
-        request_user = self.context.get('request').user.id
-        return Follow.objects.filter(author=user_id,
-                                     user=request_user).exists()
+        return obj.id in user_relations(
+            self.context.get('request')).following
@@ -1,3 +1,4 @@
+from django.db.models import Prefetch
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status
@@ -5,8 +6,9 @@ from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from api.pagination import LimitPageNumberPagination
-from api.serializers import FollowSerializer
+from api.models import Recipe
+from api.pagination import FeedPagination, LimitPageNumberPagination
+from api.serializers import FollowSerializer, RecipesLimitSerializer
 
 from .models import Follow, User
 from .serializers import CustomUserSerializer
@@ -19,6 +21,12 @@ class CustomUserViewSet(UserViewSet):
     pagination_class = LimitPageNumberPagination
     permission_classes = (IsAuthenticated, )
 
+    def get_recipes_limit(self):
+        '''recipes_limit из запроса; неверное значение - ошибка 400.'''
+        serializer = RecipesLimitSerializer(data=self.request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data.get('recipes_limit')
+
     @action(detail=True, methods=['POST', 'DELETE'],
             permission_classes=(IsAuthenticated,))
     def subscribe(self, request, **kwargs):
@@ -26,8 +34,9 @@ class CustomUserViewSet(UserViewSet):
         author_id = self.kwargs.get('id')
         author = get_object_or_404(User, id=author_id)
         if request.method == 'POST':
-            serializer = FollowSerializer(author, data=request.data,
-                                          context={'request': request})
+            serializer = FollowSerializer(author, data=request.data, context={
+                'request': request,
+                'recipes_limit': self.get_recipes_limit()})
             serializer.is_valid(raise_exception=True)
             Follow.objects.create(user=user, author=author)
             return Response(serializer.data,
@@ -38,10 +47,17 @@ class CustomUserViewSet(UserViewSet):
             return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=False, methods=['GET'],
-            permission_classes=(IsAuthenticated,))
+            permission_classes=(IsAuthenticated,),
+            pagination_class=FeedPagination)
     def subscriptions(self, request):
         user = request.user
-        queryset = User.objects.filter(following__user=user)
+        limit = self.get_recipes_limit()
+        recipes = Recipe.objects.only('id', 'name', 'image', 'variants_image',
+                                      'cooking_time', 'author')
+        if limit is not None:
+            recipes = recipes[:limit]
+        queryset = User.objects.filter(following__user=user).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes'))
         pages = self.paginate_queryset(queryset)
         serializer = FollowSerializer(pages, many=True,
                                       context={'request': request})